@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+# Measures the memory taken by the rule periods and journeys that turf_report.py builds, per million takeovers.
+# Rule periods are compared as the old dict-based objects holding datetimes and the current slotted ones holding
+# epoch seconds. Journeys are compared as the old list of journey objects and what the ConnectionIndex keeps by
+# pair of zones instead: a different structure, holding only what the reports use.
+# Each measurement runs in its own process and uses the growth in peak resident memory.
+
+import sys, os, subprocess, resource, argparse
+from datetime import datetime, timedelta
+import turf_report
+
+class LegacyRulePeriod:
+    def __init__(self, zone, user, startTime, endTime, complete=True):
+        self.zone = zone
+        self.user = user
+        self.startTime = startTime
+        self.endTime = endTime
+        self.complete = complete
+
+class LegacyJourney:
+    def __init__(self, startZone, endZone, startTime, endTime):
+        self.startZone = startZone
+        self.endZone = endZone
+        self.startTime = startTime
+        self.endTime = endTime
+
+def getPeakKb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def makePeriods(legacy, takeovers, zones, users, startEpoch):
+    periods = []
+    for i in xrange(takeovers):
+        zone, user = zones[i % len(zones)], users[i % len(users)]
+        start, end = startEpoch + i * 60, startEpoch + i * 60 + 3600
+        if legacy:
+            periods.append(LegacyRulePeriod(zone, user, datetime.utcfromtimestamp(start), datetime.utcfromtimestamp(end)))
+        else:
+            periods.append(turf_report.RulePeriod(zone, user, start, end))
+    return periods
+
+def makeJourneys(legacy, takeovers, zones, users, startEpoch):
+    journeys = [] if legacy else turf_report.ConnectionIndex()
+    for i in xrange(takeovers):
+        zone, nextZone = zones[i % len(zones)], zones[(i + 1) % len(zones)]
+        start = startEpoch + i * 60
+        if legacy:
+            startTime = datetime.utcfromtimestamp(start)
+            journeys.append(LegacyJourney(zone, nextZone, startTime, startTime + timedelta(minutes=5)))
+        else:
+            journeys.addJourney(zone, nextZone, start, start + 300)
+    return journeys
+
+# What each measurement builds, in the order printed
+measurements = [ ("periods-before", "rule periods, dict-based with datetimes", makePeriods, True),
+                 ("periods-after", "rule periods, slotted with epoch seconds", makePeriods, False),
+                 ("journeys-before", "journeys, a list of dict-based objects with datetimes", makeJourneys, True),
+                 ("journeys-after", "journeys, durations in a ConnectionIndex", makeJourneys, False) ]
+
+def measure(mode, takeovers, zoneCount=1000, userCount=100):
+    # The zones and users are the same for every measurement, so they are made before it starts
+    zones = [ turf_report.Zone(i, None, u"Zone" + str(i), 65, 1, 12.0, 57.7) for i in range(zoneCount) ]
+    users = [ turf_report.User(userId=i + 1) for i in range(userCount) ]
+    _, _, makeFunction, legacy = [ m for m in measurements if m[0] == mode ][0]
+    before = getPeakKb()
+    objects = makeFunction(legacy, takeovers, zones, users, 1433152800)
+    return (getPeakKb() - before) * 1024.0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Measure memory used per million takeovers')
+    parser.add_argument('-n', '--takeovers', type=int, default=200000, help='number of takeovers to create')
+    parser.add_argument('--mode', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.mode:
+        print measure(args.mode, args.takeovers)
+    else:
+        for mode, description, _, _ in measurements:
+            output = subprocess.check_output([ sys.executable, os.path.abspath(__file__), "--mode", mode, "-n", str(args.takeovers) ])
+            bytesUsed = float(output)
+            print str(int(bytesUsed * 1000000 / args.takeovers / (1024 * 1024))).rjust(6), "MB per million takeovers:", description
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+
+# Times the stages of turf_report.py on data from synthetic_round.py at several sizes, and records
+# the peak resident memory after each stage. Each size runs in its own process on a fresh sandbox,
+# so the periods are read twice: once building the checkpoint and SQLite store, and once using them.
+# Results are appended to bench_results.txt, one run per line, and compared with the last stored run
+# with the same parameters so that slowdowns show up.
+
+import sys, os, time, subprocess, resource, argparse, tempfile, shutil
+import synthetic_round, user_directory, static_data
+
+currDir = os.path.dirname(os.path.abspath(__file__))
+paramNames = [ "zones", "users", "takeovers", "days", "rounds", "seed", "maxtime", "searchtime" ]
+
+def getPeakMb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+class StageTimer:
+    def __init__(self):
+        self.stages = []
+
+    def run(self, name, function, *args):
+        start = time.time()
+        result = function(*args)
+        self.stages.append((name, round(time.time() - start, 3), round(getPeakMb(), 1)))
+        return result
+
+def readPeriods(turf_report, fileName, staticData, showUser, store):
+    userZoneIds = store.getUserZoneIds(showUser.userId, [ fileName ] + turf_report.getEarlierRounds())
+    allRulePeriods = []
+    for zone, zonePeriods in turf_report.streamZonePeriods(fileName, False, staticData, {}, None, showUser, areaZoneIds=userZoneIds):
+        allRulePeriods += turf_report.filterUserPeriods(zonePeriods, showUser)
+    allRulePeriods.sort(key=lambda rp: rp.startEpoch)
+    return allRulePeriods
+
+def runQuietly(function, *args):
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        function(*args)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+def measure(args):
+    sandbox = tempfile.mkdtemp(prefix="bench_report")
+    try:
+        takeoverCount = synthetic_round.writeSandbox(sandbox, args.zones, args.users, args.takeovers, args.days, args.rounds, args.seed)
+        os.chdir(sandbox) # earlier rounds are found in the current directory
+        import turf_report
+        turf_report.User.directory = user_directory.UserDirectory(os.path.join(sandbox, user_directory.defaultName))
+        staticData = static_data.StaticZoneData.load(sandbox).zones
+        fileName = os.path.join(sandbox, "curr_turf_data.bin")
+        showUser = turf_report.User(userId=1)
+        store = turf_report.openStore(sandbox)
+        timer = StageTimer()
+        for run in "cold", "warm":
+            allRulePeriods = timer.run("read periods (" + run + ")", readPeriods, turf_report, fileName, staticData, showUser, store)
+            timer.run("earlier rounds (" + run + ")", turf_report.addDataFromEarlierRounds, allRulePeriods, showUser, staticData, {}, None, None, store)
+
+        connectionIndex = timer.run("connection index", turf_report.makeConnectionIndex, allRulePeriods)
+        # Start and end where the user has been most, which is sure to be connected
+        visits = {}
+        for rulePeriod in allRulePeriods:
+            visits[rulePeriod.zone] = visits.get(rulePeriod.zone, 0) + 1
+        startZoneId = max(visits.keys(), key=lambda zone: (visits[zone], zone.zoneId)).zoneId
+        routeFinder = timer.run("route graph", turf_report.RouteFinder.create, connectionIndex, startZoneId, startZoneId)
+        timer.run("route search", runQuietly, routeFinder.findOptimized, args.maxtime, args.searchtime)
+        timer.run("pivot search", runQuietly, routeFinder.findBest, args.maxtime)
+        result = dict(((name, getattr(args, name)) for name in paramNames))
+        result.update(takeoverCount=takeoverCount, userPeriods=len(allRulePeriods), stages=timer.stages)
+        return result
+    finally:
+        shutil.rmtree(sandbox, ignore_errors=True)
+
+def getRevision():
+    try:
+        with open(os.devnull, "w") as devnull:
+            return subprocess.check_output([ "git", "rev-parse", "--short", "HEAD" ], cwd=currDir, stderr=devnull).strip()
+    except (OSError, subprocess.CalledProcessError):
+        pass
+
+def readResults(fileName):
+    if not os.path.isfile(fileName):
+        return []
+    return [ eval(line) for line in open(fileName) if line.strip() ]
+
+def findPrevious(results, result):
+    for prevResult in reversed(results):
+        if all((prevResult.get(name) == result[name] for name in paramNames)):
+            return prevResult
+
+def printResult(result, prevResult):
+    print "Zones", result["zones"], "-", result["takeoverCount"], "takeovers,", result["userPeriods"], "periods for user 1"
+    prevTimes = dict(((name, secs) for name, secs, _ in prevResult["stages"])) if prevResult else {}
+    for name, secs, peakMb in result["stages"]:
+        text = "  " + name.ljust(24) + ("%.3fs" % secs).rjust(10) + ("%.1f MB" % peakMb).rjust(12)
+        prevSecs = prevTimes.get(name)
+        if prevSecs:
+            text += "   (was %.3fs, x%.2f)" % (prevSecs, secs / prevSecs)
+        print text
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Time the stages of turf_report.py on synthetic data')
+    parser.add_argument('-s', '--sizes', default="250,500,1000", help='comma-separated numbers of zones to measure')
+    parser.add_argument('-u', '--users', type=int, default=200, help='number of users')
+    parser.add_argument('-t', '--takeovers', type=float, default=1.0, help='takeovers per zone per day')
+    parser.add_argument('-d', '--days', type=int, default=30, help='length of each round in days')
+    parser.add_argument('-r', '--rounds', type=int, default=1, help='number of earlier rounds')
+    parser.add_argument('-m', '--maxtime', type=int, default=60, help='maximum time in minutes for the route search')
+    parser.add_argument('-S', '--searchtime', type=float, default=10, help='maximum seconds for the route search, as turf_report.py -s')
+    parser.add_argument('--seed', type=int, default=1, help='random seed for the data')
+    parser.add_argument('-o', '--output', default=os.path.join(currDir, "bench_results.txt"), help='file to append results to')
+    parser.add_argument('--zones', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.zones:
+        print repr(measure(args))
+    else:
+        results = readResults(args.output)
+        for size in map(int, args.sizes.split(",")):
+            command = [ sys.executable, os.path.abspath(__file__), "--zones", str(size), "-u", str(args.users), "-t", str(args.takeovers),
+                        "-d", str(args.days), "-r", str(args.rounds), "-m", str(args.maxtime), "-S", str(args.searchtime), "--seed", str(args.seed) ]
+            result = eval(subprocess.check_output(command))
+            result.update(time=int(time.time()), revision=getRevision())
+            printResult(result, findPrevious(results, result))
+            results.append(result)
+            with open(args.output, "a") as f:
+                f.write(repr(result) + "\n")
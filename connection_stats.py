@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+
+# Journey statistics between pairs of zones for turf_report.py, kept up to date one journey at a time
+# and saved per user between runs, so only journeys made since the last run need adding.
+# Each pair keeps its durations in the order made and in sorted order. The average ignores journeys
+# that were probably walked: those more than a given ratio over the average, repeated until none are.
+# As the cutoff only comes down, that is found by dropping durations off the top of the sorted list.
+# Polls don't always see takeovers in the order they happened, so the stats note how much of the log they
+# have counted, and start again if the log has been replaced or has since gained a takeover by the user from before
+# the last one counted.
+# Journeys from earlier rounds are older than any in the log, so the stats also note the names and sizes of the
+# archived rounds, and start again if those change.
+
+import os, bisect
+from datetime import timedelta
+import takeover_log, pickled_state
+
+class DurationStats(object):
+    __slots__ = ("durations", "sortedDurations", "total")
+    def __init__(self):
+        self.durations = []
+        self.sortedDurations = []
+        self.total = 0
+
+    def add(self, secs):
+        self.durations.append(secs)
+        bisect.insort(self.sortedDurations, secs)
+        self.total += secs
+
+    def getAverage(self, ratio):
+        # Returns the average as a timedelta, and the longest duration that counted towards it
+        count, total = len(self.sortedDurations), self.total
+        while True:
+            avgDuration = timedelta(seconds=total) / count
+            maxCycling = timedelta(seconds=(avgDuration.seconds * ratio))
+            newCount = count
+            while timedelta(seconds=self.sortedDurations[newCount - 1]) > maxCycling:
+                newCount -= 1
+                total -= self.sortedDurations[newCount]
+            if newCount == count:
+                return avgDuration, self.sortedDurations[count - 1]
+            count = newCount
+
+    def getCounted(self, maxSecs):
+        return [ secs for secs in self.durations if secs <= maxSecs ]
+
+class ConnectionStats(pickled_state.PickledState):
+    version = 5
+    def __init__(self, fileName, tzOffset):
+        pickled_state.PickledState.__init__(self)
+        self.fileName = fileName
+        self.tzOffset = tzOffset
+        self.recordCount = 0
+        self.firstRecord = None
+        self.lastTakeoverEpoch = None
+        self.archiveStamps = []
+        self.clear()
+        self.changed = False
+
+    def clear(self):
+        self.lastEndEpoch = None
+        self.countAtLastEnd = 0
+        self.seenAtLastEnd = 0
+        self.durationsByPair = {}
+        self.changed = True
+
+    @classmethod
+    def load(cls, fileName, tzOffset):
+        # Journey times are in local time, so they don't match up if the offset has changed
+        stats = cls.loadPickle(fileName)
+        if stats is not None and stats.tzOffset == tzOffset:
+            stats.fileName = fileName
+            stats.seenAtLastEnd = 0
+            stats.changed = False
+            return stats
+        return cls(fileName, tzOffset)
+
+    def checkLog(self, logFileName, userId, archiveFileNames=()):
+        # Call before adding journeys, which then need to include all those from the log and the archived rounds
+        count = takeover_log.countRecords(logFileName)
+        epochs = self.getTakeoverEpochs(logFileName, userId, self.recordCount)
+        archiveStamps = sorted(((os.path.basename(fileName), os.path.getsize(fileName)) for fileName in archiveFileNames))
+        if takeover_log.isReplaced(logFileName, self.recordCount, self.firstRecord) or archiveStamps != self.archiveStamps or \
+                (epochs and self.lastTakeoverEpoch is not None and min(epochs) < self.lastTakeoverEpoch):
+            self.clear()
+            self.recordCount = 0
+            self.lastTakeoverEpoch = None
+            self.archiveStamps = archiveStamps
+            epochs = self.getTakeoverEpochs(logFileName, userId, 0)
+        if epochs:
+            self.lastTakeoverEpoch = max(epochs + [ self.lastTakeoverEpoch ])
+        if count != self.recordCount:
+            self.recordCount = count
+            self.firstRecord = takeover_log.readFirstRecord(logFileName)
+            self.changed = True
+
+    def getTakeoverEpochs(self, logFileName, userId, startRecord):
+        return [ epoch for _, epoch, ownerId in takeover_log.iterRecords(logFileName, startRecord) if ownerId == userId ]
+
+    def addJourney(self, startZoneId, endZoneId, startEpoch, endEpoch):
+        # Journeys come in time order, and any up to the last one seen are in already.
+        # Several can end at the same time, so count those
+        if self.lastEndEpoch is not None and endEpoch < self.lastEndEpoch:
+            return
+        if endEpoch == self.lastEndEpoch:
+            if self.seenAtLastEnd < self.countAtLastEnd:
+                self.seenAtLastEnd += 1
+                return
+            self.countAtLastEnd += 1
+        else:
+            self.lastEndEpoch = endEpoch
+            self.countAtLastEnd = 1
+        self.seenAtLastEnd = self.countAtLastEnd
+        self.getDurations(startZoneId, endZoneId).add(endEpoch - startEpoch)
+        self.changed = True
+
+    def getDurations(self, startZoneId, endZoneId):
+        return self.durationsByPair.setdefault((startZoneId, endZoneId), DurationStats())
+
+    def save(self):
+        if not self.changed:
+            return
+        self.savePickle(self.fileName)
+        self.changed = False
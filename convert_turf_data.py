@@ -0,0 +1,15 @@
+#!/usr/bin/env python
+
+# One-shot converter from the old pprint'ed *_turf_data.txt files to the binary takeover log.
+# With no arguments, converts curr_turf_data.txt, prev_turf_data.txt and all archived rounds in this directory.
+
+import os, sys
+from glob import glob
+import takeover_log
+
+currDir = os.path.dirname(os.path.abspath(__file__))
+fileNames = sys.argv[1:] or glob(os.path.join(currDir, "*_turf_data.txt"))
+for txtFileName in sorted(fileNames):
+    binFileName = txtFileName[:-4] + ".bin"
+    count = takeover_log.convertFile(txtFileName, binFileName)
+    print "Wrote", count, "records from", os.path.basename(txtFileName), "to", os.path.basename(binFileName)
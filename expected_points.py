@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+
+# Batch version of Zone.setExpectedPoints, working on all zones at once with numpy.
+# Rule periods are flat arrays: zone index, start and end epoch seconds, user id and complete flag,
+# with each zone's periods in time order. Zone values are arrays indexed by zone index, with NaN
+# for no previous average. The result uses NaN where the zone would be left without expected points.
+#
+# If the totals of the completed periods are already known (e.g. from the report checkpoint), pass them
+# together with the period counts: then only the last period of each zone is needed in the arrays.
+
+import numpy
+
+def getPoints(takepoints, pph, startEpochs, endEpochs):
+    hoursHeld = (endEpochs - startEpochs) / 3600.0
+    return takepoints + numpy.trunc(hoursHeld * pph)
+
+def getAverage(pointTotal, pointCount):
+    # Python 2's round() rounds halves away from zero, unlike numpy.round
+    return numpy.floor(pointTotal / pointCount + 0.5)
+
+def calculateExpectedPoints(takepoints, pph, prevAvg, zoneIndex, startEpochs, endEpochs, userIds, complete,
+                            forUserId=None, completeTotals=None, periodCounts=None):
+    zoneCount = len(takepoints)
+    takepoints = numpy.asarray(takepoints, dtype=numpy.float64)
+    pph = numpy.asarray(pph, dtype=numpy.float64)
+    prevAvg = numpy.asarray(prevAvg, dtype=numpy.float64)
+    zoneIndex = numpy.asarray(zoneIndex, dtype=numpy.intp)
+    complete = numpy.asarray(complete, dtype=bool)
+
+    points = getPoints(takepoints[zoneIndex], pph[zoneIndex], numpy.asarray(startEpochs, dtype=numpy.float64),
+                       numpy.asarray(endEpochs, dtype=numpy.float64))
+    if completeTotals is None:
+        pointTotal = numpy.bincount(zoneIndex, weights=numpy.where(complete, points, 0), minlength=zoneCount)
+        pointCount = numpy.bincount(zoneIndex, weights=complete, minlength=zoneCount)
+        periodCounts = numpy.bincount(zoneIndex, minlength=zoneCount)
+    else:
+        pointTotal = numpy.array(completeTotals[0], dtype=numpy.float64)
+        pointCount = numpy.array(completeTotals[1], dtype=numpy.float64)
+        periodCounts = numpy.asarray(periodCounts)
+
+    lastIndex = numpy.full(zoneCount, -1, dtype=numpy.intp)
+    numpy.maximum.at(lastIndex, zoneIndex, numpy.arange(len(zoneIndex)))
+    hasPeriods = lastIndex >= 0
+    lastIx = numpy.where(hasPeriods, lastIndex, 0)
+    lastPoints = numpy.where(hasPeriods, points[lastIx] if len(points) else 0, numpy.nan)
+    lastIncomplete = hasPeriods & ~complete[lastIx] if len(points) else hasPeriods
+    hasPrev = ~numpy.isnan(prevAvg)
+
+    allTotal = pointTotal + numpy.where(hasPrev, prevAvg, 0)
+    allCount = pointCount + hasPrev
+    with numpy.errstate(invalid="ignore", divide="ignore"):
+        expected = getAverage(allTotal, allCount)
+        withIncomplete = getAverage(allTotal + lastPoints, allCount + 1)
+        expected = numpy.where(lastIncomplete & (lastPoints > expected), withIncomplete, expected)
+
+    expected = numpy.where((periodCounts == 1) & ~hasPrev, lastPoints, expected)
+    expected = numpy.where((periodCounts == 0) & hasPrev, prevAvg, expected)
+    expected = numpy.where((periodCounts == 0) & ~hasPrev, numpy.nan, expected)
+
+    if forUserId is not None and len(points):
+        lastHours = (numpy.asarray(endEpochs, dtype=numpy.float64)[lastIx] - numpy.asarray(startEpochs, dtype=numpy.float64)[lastIx]) / 3600.0
+        isMine = lastIncomplete & (numpy.asarray(userIds)[lastIx] == forUserId)
+        mineExpected = numpy.where(lastHours > 23, numpy.floor(takepoints / 2), 0)
+        expected = numpy.where(isMine, mineExpected, expected)
+    return expected
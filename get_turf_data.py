@@ -2,70 +2,138 @@
 # -*- coding: utf-8 -*-
 
 
-import requests, os
-from datetime import datetime
-from pprint import pprint
+import requests, os, sys, time, argparse
+import takeover_log, turf_api, poll_scheduler, run_profile, static_data
 
 reqver = tuple(map(int, requests.__version__.split(".")))
 if reqver <= (2, 4, 1):
     sys.stderr.write("ERROR: Python requests module must be at least version 2.4.2, found version " + requests.__version__ + "\n")
     sys.exit(1)
 
+currDir = os.path.dirname(os.path.abspath(__file__))
+fileName = os.path.join(currDir, "curr_turf_data.bin")
+scheduleFile = os.path.join(currDir, "poll_schedule.txt")
+
+# Hardcode any extra zones you want to monitor here
+newZoneNames = []
+
 def get_new_zones(user):
-    r = requests.post('http://api.turfgame.com/v4/users', json=[{"name" : user}])
-    dict = r.json()[0]
+    dict = turf_api.get_users_from_list("name", [ user ])[0]
     return dict["zones"]
 
-def get_zones_from_list(dataType, info):
-    zoneRequestData = [{ dataType : zdat } for zdat in info ]
-    r = requests.post('http://api.turfgame.com/v4/zones', json=zoneRequestData)
-    return r.json(), r.encoding
-
-currDir = os.path.dirname(os.path.abspath(__file__))
-fileName = os.path.join(currDir, "curr_turf_data.txt")
-zoneData = eval(open(fileName).read()) if os.path.isfile(fileName) else {}
-zoneIds = zoneData.keys()
+def read_config_user():
+    configFileName = os.path.join(currDir, "turf_config.txt")
+    if not os.path.isfile(configFileName):
+        sys.stderr.write("ERROR: no config file found at " + configFileName + ": please create!\n")
+        sys.exit(1)
 
-configFileName = os.path.join(currDir, "turf_config.txt")
-if not os.path.isfile(configFileName):
-    sys.stderr.write("ERROR: no config file found at " + configFileName + ": please create!\n")
-    sys.exit(1)
+    configDict = eval(open(configFileName).read())
+    return configDict.get("username")
 
-configDict = eval(open(configFileName).read())
-user = configDict.get("username")
+def get_monitored_zones(user, latestData, store=None):
+    zoneIds = latestData.keys()
+    for newZoneId in get_new_zones(user):
+        if newZoneId not in zoneIds:
+            zoneIds.append(newZoneId)
 
-for newZoneId in get_new_zones(user):
-    if newZoneId not in zoneIds:
-        zoneIds.append(newZoneId)
+    for newZoneId in find_new_zone_ids(store):
+        if newZoneId not in zoneIds:
+            zoneIds.append(newZoneId)
+    return zoneIds
 
-# Hardcode any extra zones you want to monitor here
-newZoneNames = []
-if len(newZoneNames):
-    zoneInfoList, _ = get_zones_from_list("name", newZoneNames)
-    for zoneInfo in zoneInfoList:
-        if zoneInfo["id"] not in zoneIds:
-            zoneIds.append(zoneInfo["id"])
-
-staticZoneData = {}
-zoneInfoList, encoding = get_zones_from_list("id", zoneIds)
-for zoneInfo in zoneInfoList: 
-    currId = zoneInfo["id"]
-    prevData = None
-    staticZoneData[currId] = zoneInfo["name"], zoneInfo["takeoverPoints"], zoneInfo["pointsPerHour"], zoneInfo["longitude"], zoneInfo["latitude"]
-    if "dateLastTaken" in zoneInfo and "currentOwner" in zoneInfo:
-        dataNow = zoneInfo["dateLastTaken"], zoneInfo["currentOwner"]["id"]
-        if currId in zoneData:
-            recordsList = zoneData.get(currId)
-            if dataNow not in recordsList:
-                recordsList.append(dataNow)
+def find_new_zone_ids(store=None):
+    # Zones already in the local store are found by name there, and only the rest are asked about.
+    # A store that is passed in is left open for the caller
+    newZoneIds, unknownNames = [], []
+    ownStore = store is None and len(newZoneNames) > 0
+    if ownStore:
+        store = open_store()
+    for name in newZoneNames:
+        row = store.findZone(name) if store else None
+        if row:
+            newZoneIds.append(row[0])
         else:
-            zoneData[currId] = [ dataNow ]
-    else:
-        zoneData[currId] = []
+            unknownNames.append(name)
+    if ownStore and store:
+        store.close()
+    if unknownNames:
+        zoneInfoList, _ = turf_api.get_zones_from_list("name", unknownNames)
+        newZoneIds += [ zoneInfo["id"] for zoneInfo in zoneInfoList ]
+    return newZoneIds
+
+def poll_zones(zoneIds, latestData, staticZoneData):
+    newRecords = []
+    zoneInfoList, encoding = turf_api.get_zones_from_list("id", zoneIds)
+    for zoneInfo in zoneInfoList: 
+        currId = zoneInfo["id"]
+        staticZoneData.update(currId, (zoneInfo["name"], zoneInfo["takeoverPoints"], zoneInfo["pointsPerHour"], zoneInfo["longitude"], zoneInfo["latitude"]))
+        if "dateLastTaken" in zoneInfo and "currentOwner" in zoneInfo:
+            dataNow = takeover_log.parseApiDate(zoneInfo["dateLastTaken"]), zoneInfo["currentOwner"]["id"]
+            if latestData.get(currId) != dataNow:
+                newRecords.append((currId,) + dataNow)
+                latestData[currId] = dataNow
+        elif currId not in latestData:
+            newRecords.append((currId, 0, 0))
+            latestData[currId] = 0, 0
 
-with open(fileName, "w") as f:
-    pprint(zoneData, f)
+    takeover_log.appendRecords(fileName, newRecords)
+    return newRecords
 
-staticFile = os.path.join(currDir, "static_zone_data.txt")
-with open(staticFile, "w") as f:
-    pprint(staticZoneData, f)
+def open_store():
+    # The SQLite store is only kept if this Python has sqlite3
+    try:
+        import turf_store
+    except ImportError:
+        return
+    return turf_store.TurfStore(os.path.join(currDir, turf_store.defaultName))
+
+def update_store(staticZoneData, store=None):
+    # Copies the new takeovers and any changed zone details into the store, opening it if none is passed in
+    ownStore = store is None
+    if ownStore:
+        store = open_store()
+        if store is None:
+            return
+    try:
+        store.sync(fileName)
+        store.updateZones(staticZoneData)
+        store.setLastPoll(int(time.time()))
+    finally:
+        if ownStore:
+            store.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Fetch turf data for monitored zones')
+    parser.add_argument('-b', '--budget', type=int, help='maximum number of zones to fetch, picking those most likely to have been taken')
+    parser.add_argument('-i', '--max-interval', type=float, default=6, help='hours after which a zone is always fetched when using a budget')
+    parser.add_argument('-m', '--missed', action='store_true', help='print how many takeovers were probably missed')
+    parser.add_argument('--profile', nargs="?", const="", help='append stage timings, API request counts and peak memory as a JSON line to the given file, or ' + run_profile.defaultName)
+    args = parser.parse_args()
+    run_profile.start("get_turf_data", args.profile, currDir)
+
+    with run_profile.stage("latest records"):
+        latestData = takeover_log.latestRecords(fileName)
+    with run_profile.stage("monitored zones"):
+        zoneIds = get_monitored_zones(read_config_user(), latestData)
+    with run_profile.stage("static data"):
+        staticZoneData = static_data.StaticZoneData.load(currDir, poller=True)
+    if args.budget:
+        now = time.time()
+        with run_profile.stage("schedule"):
+            scheduler = poll_scheduler.PollScheduler(args.budget, args.max_interval * 3600)
+            scheduler.readHistory(fileName)
+            scheduler.readState(scheduleFile)
+            pollIds = scheduler.chooseZones(zoneIds, now)
+        with run_profile.stage("poll zones"):
+            newRecords = poll_zones(pollIds, latestData, staticZoneData)
+        scheduler.recordPoll(pollIds, newRecords, now)
+        scheduler.writeState(scheduleFile)
+        if args.missed:
+            print scheduler.describeMissed(zoneIds, now)
+    else:
+        with run_profile.stage("poll zones"):
+            poll_zones(zoneIds, latestData, staticZoneData)
+    with run_profile.stage("static data"):
+        staticZoneData.save()
+    with run_profile.stage("store"):
+        update_store(staticZoneData.zones)
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+
+# Per-user index of the rule periods in an archived round, as (zoneId, start, end) in local epoch seconds, so the time report and route finder
+# don't have to re-read every old round on each run. Only used where Python has no sqlite3: otherwise the SQLite store answers this.
+# Archives never change after rollover, but if one does, or the local time offset changes, its index is rebuilt.
+
+import os
+import report_checkpoint, pickled_state
+
+class HistoryIndex(pickled_state.PickledState):
+    version = 2
+    def __init__(self, fileName, fileStamp, tzOffset):
+        pickled_state.PickledState.__init__(self)
+        self.fileName = fileName
+        self.fileStamp = fileStamp
+        self.tzOffset = tzOffset
+        self.periodsByUser = {}
+
+    @classmethod
+    def getIndexFile(cls, fileName):
+        return fileName + ".history"
+
+    @classmethod
+    def getFileStamp(cls, fileName):
+        info = os.stat(fileName)
+        return info.st_size, info.st_mtime
+
+    @classmethod
+    def load(cls, fileName, tzOffset):
+        fileStamp = cls.getFileStamp(fileName)
+        index = cls.loadPickle(cls.getIndexFile(fileName))
+        if index is not None and index.fileStamp == fileStamp and index.tzOffset == tzOffset:
+            index.fileName = fileName
+            return index
+        return cls(fileName, fileStamp, tzOffset)
+
+    def localTime(self, epoch):
+        return epoch + self.tzOffset
+
+    def buildUserPeriods(self, userId, roundEndTime, staticData):
+        checkpoint = report_checkpoint.ReportCheckpoint.load(self.fileName)
+        checkpoint.update(staticData)
+        checkpoint.save()
+        userPeriods = []
+        for zoneId, periods in checkpoint.periodsByZone.items():
+            for periodUserId, startEpoch, endEpoch in periods:
+                if periodUserId == userId:
+                    userPeriods.append((zoneId, self.localTime(startEpoch), self.localTime(endEpoch)))
+            current = checkpoint.currentOwners.get(zoneId)
+            if current is not None and current[0] == userId:
+                userPeriods.append((zoneId, self.localTime(current[1]), roundEndTime))
+        userPeriods.sort(key=lambda p: p[1])
+        return userPeriods
+
+    def getUserPeriods(self, userId, roundEndTime, staticData):
+        if userId not in self.periodsByUser:
+            self.periodsByUser[userId] = self.buildUserPeriods(userId, roundEndTime, staticData)
+            self.save()
+        return self.periodsByUser[userId]
+
+    def save(self):
+        self.savePickle(self.getIndexFile(self.fileName))
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+
+# Keeps the route finder's shortest-path rows between runs as .npy files that are loaded memory-mapped.
+# Entries are keyed by a hash of the zone ids and the sparse journey time graph, and hold a row of
+# times and predecessors for each source zone the route finder needed.
+# When there is no exact match but an earlier entry has the same zones and only a few changed connections,
+# its rows are repaired instead: sources whose shortest paths used a connection that got slower or disappeared
+# are calculated again, and connections that got faster or are new are relaxed into the others.
+
+import os, hashlib, shutil
+import numpy
+from scipy.sparse import csr_matrix
+
+class ShortestPathCache:
+    maxEntries = 5
+    maxRepairEdges = 50
+    arrayNames = [ "zone_ids", "graph_data", "graph_indices", "graph_indptr", "sources", "shortest_paths", "predecessors" ]
+    def __init__(self, cacheDir, zoneIds, graph):
+        self.cacheDir = cacheDir
+        self.zoneIds = numpy.asarray(zoneIds, dtype=numpy.int64)
+        self.graph = graph
+        self.key = self.getKey()
+
+    def getKey(self):
+        hasher = hashlib.sha1()
+        for array in self.zoneIds, self.graph.data, self.graph.indices, self.graph.indptr:
+            hasher.update(numpy.ascontiguousarray(array).tobytes())
+        return hasher.hexdigest()
+
+    def getEntryDir(self, key):
+        return os.path.join(self.cacheDir, key)
+
+    def getEntriesByAge(self):
+        if not os.path.isdir(self.cacheDir):
+            return []
+        keys = os.listdir(self.cacheDir)
+        return sorted(keys, key=lambda key: os.path.getmtime(self.getEntryDir(key)), reverse=True)
+
+    def loadEntry(self, key):
+        entryDir = self.getEntryDir(key)
+        fileNames = [ os.path.join(entryDir, name + ".npy") for name in self.arrayNames ]
+        if all((os.path.isfile(fileName) for fileName in fileNames)):
+            return dict(((name, numpy.load(fileName, mmap_mode="r")) for name, fileName in zip(self.arrayNames, fileNames)))
+
+    def makeRows(self, sources, paths, predecessors):
+        return dict(zip(sources.tolist(), paths)), dict(zip(sources.tolist(), predecessors))
+
+    def load(self):
+        # Returns the rows of shortest paths and predecessors by source that are valid for this graph
+        entry = self.loadEntry(self.key)
+        if entry is not None:
+            os.utime(self.getEntryDir(self.key), None)
+            return self.makeRows(entry["sources"], entry["shortest_paths"], entry["predecessors"])
+
+        for key in self.getEntriesByAge():
+            entry = self.loadEntry(key)
+            if entry is not None and numpy.array_equal(entry["zone_ids"], self.zoneIds):
+                return self.repair(entry)
+        return {}, {}
+
+    def repair(self, entry):
+        oldGraph = csr_matrix((entry["graph_data"], entry["graph_indices"], entry["graph_indptr"]), shape=self.graph.shape)
+        changed = numpy.transpose((oldGraph != self.graph).nonzero())
+        if len(changed) > self.maxRepairEdges:
+            return {}, {}
+        from scipy.sparse.csgraph import dijkstra
+        sources = entry["sources"]
+        paths, predecessors = numpy.array(entry["shortest_paths"]), numpy.array(entry["predecessors"])
+        affected = numpy.zeros(len(sources), dtype=bool)
+        faster = []
+        for u, v in changed:
+            oldSecs, newSecs = oldGraph[u, v], self.graph[u, v]
+            if newSecs and (not oldSecs or newSecs < oldSecs):
+                faster.append((u, v, newSecs))
+            else:
+                affected |= predecessors[:, v] == u
+
+        # Without the slower connections, the old paths are the shortest that don't use a faster one. A shorter path
+        # goes as before to the first faster connection (u, v) it uses, and then as the shortest path from v
+        rows = {}
+        if faster:
+            ends = sorted(set((v for _, v, _ in faster)))
+            endPaths, endPredecessors = dijkstra(self.graph, indices=ends, return_predecessors=True)
+            for u, v, secs in faster:
+                k = ends.index(v)
+                via = paths[:, u][:, numpy.newaxis] + secs + endPaths[k][numpy.newaxis, :]
+                viaPredecessors = endPredecessors[k].copy()
+                viaPredecessors[v] = u
+                better = via < paths
+                paths = numpy.where(better, via, paths)
+                predecessors = numpy.where(better, viaPredecessors[numpy.newaxis, :], predecessors)
+            rows.update(zip(ends, zip(endPaths, endPredecessors)))
+        if affected.any():
+            affectedSources = sources[affected]
+            paths[affected], predecessors[affected] = dijkstra(self.graph, indices=affectedSources, return_predecessors=True)
+        rows.update(zip(sources.tolist(), zip(paths, predecessors)))
+        return dict(((source, row[0]) for source, row in rows.items())), dict(((source, row[1]) for source, row in rows.items()))
+
+    def save(self, paths, predecessors):
+        sources = sorted(paths)
+        if not sources:
+            return
+        arrays = { "zone_ids" : self.zoneIds,
+                   "graph_data" : self.graph.data,
+                   "graph_indices" : self.graph.indices,
+                   "graph_indptr" : self.graph.indptr,
+                   "sources" : numpy.array(sources, dtype=numpy.int64),
+                   "shortest_paths" : numpy.array([ paths[source] for source in sources ]),
+                   "predecessors" : numpy.array([ predecessors[source] for source in sources ]) }
+        entryDir = self.getEntryDir(self.key)
+        if not os.path.isdir(entryDir):
+            os.makedirs(entryDir)
+        # Write new files and rename them, as the old ones may still be memory-mapped
+        for name, array in arrays.items():
+            tmpFile = os.path.join(entryDir, name + ".tmp")
+            with open(tmpFile, "wb") as f:
+                numpy.save(f, array)
+            os.rename(tmpFile, os.path.join(entryDir, name + ".npy"))
+        os.utime(entryDir, None)
+        for oldKey in self.getEntriesByAge()[self.maxEntries:]:
+            shutil.rmtree(self.getEntryDir(oldKey), ignore_errors=True)
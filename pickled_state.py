@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+
+# State that the reports keep between runs as pickles. Each class has a version, raised whenever what it keeps changes,
+# and a pickle saved by another version is ignored. Pickles are written to a temporary file and renamed, so that
+# runs at the same time never see half a file.
+
+import os, tempfile, cPickle
+
+def savePickle(data, fileName):
+    dirName = os.path.dirname(os.path.abspath(fileName))
+    if not os.path.isdir(dirName):
+        os.makedirs(dirName)
+    fd, tmpFile = tempfile.mkstemp(dir=dirName, suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        cPickle.dump(data, f, cPickle.HIGHEST_PROTOCOL)
+    os.rename(tmpFile, fileName)
+
+class PickledState:
+    version = 0
+    def __init__(self):
+        self.savedVersion = self.version # pickled with the object, unlike the class's version
+
+    @classmethod
+    def loadPickle(cls, fileName):
+        # Returns what was saved in the file by this version, or None
+        if os.path.isfile(fileName):
+            with open(fileName, "rb") as f:
+                state = cPickle.load(f)
+            if getattr(state, "savedVersion", None) == cls.version:
+                return state
+
+    def savePickle(self, fileName):
+        savePickle(self, fileName)
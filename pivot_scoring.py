@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+
+# Scores every combination of a path to a pivot zone with a path onwards from it, for the route finder.
+# Paths are given as lists of zone indices, and a combination scores the points of each zone it visits once,
+# divided by the total time. The combinations are split by first path across a pool of worker processes.
+# Each worker is given the paths once when it starts, which costs nothing where workers are forked and
+# means they are pickled only once per worker where they aren't, as on Windows. Each sends back only its best few combinations.
+
+import multiprocessing
+import numpy
+
+minPoolCombinations = 100000
+sharedData = None
+
+class CombinationData:
+    def __init__(self, firstPaths, firstTimes, pivotIx, secondPaths, secondTimes, points, maxSecs, topCount):
+        # Only the zones on some path matter, so number those from 0
+        localIndices = {}
+        for path in firstPaths + secondPaths + [ [ pivotIx ] ]:
+            for ix in path:
+                localIndices.setdefault(ix, len(localIndices))
+        self.points = numpy.zeros(len(localIndices))
+        for ix, localIx in localIndices.items():
+            self.points[localIx] = points[ix]
+        self.firstVisits = self.makeVisits(firstPaths, localIndices)
+        self.firstVisits[:, localIndices[pivotIx]] = True
+        self.secondVisits = self.makeVisits(secondPaths, localIndices)
+        self.firstTimes = numpy.array(firstTimes, dtype=float)
+        self.secondTimes = numpy.array(secondTimes, dtype=float)
+        self.maxSecs = maxSecs
+        self.topCount = topCount
+
+    def makeVisits(self, paths, localIndices):
+        visits = numpy.zeros((len(paths), len(localIndices)), dtype=bool)
+        for i, path in enumerate(paths):
+            visits[i, [ localIndices[ix] for ix in path ]] = True
+        return visits
+
+    def scoreFirstPaths(self, start, end):
+        # Returns how many combinations fit in the time, and the best of them as (pps, first, second)
+        count, best = 0, []
+        secondPoints = self.secondVisits.astype(float)
+        for i in range(start, end):
+            totalTimes = self.firstTimes[i] + self.secondTimes
+            fits = numpy.flatnonzero(totalTimes <= self.maxSecs)
+            if len(fits) == 0:
+                continue
+            newPoints = self.points * ~self.firstVisits[i]
+            totalPoints = self.points[self.firstVisits[i]].sum() + secondPoints[fits].dot(newPoints)
+            times = totalTimes[fits]
+            pps = numpy.where(times > 0, totalPoints / numpy.where(times > 0, times, 1), 0.0)
+            count += len(fits)
+            order = numpy.lexsort((fits, -pps))[:self.topCount]
+            best = mergeBest(best, [ (pps[k], i, fits[k]) for k in order ], self.topCount)
+        return count, best
+
+def mergeBest(best, other, topCount):
+    return sorted(best + other, key=lambda (pps, i, j): (-pps, i, j))[:topCount]
+
+def setSharedData(data):
+    global sharedData
+    sharedData = data
+
+def scoreChunk(bounds):
+    return sharedData.scoreFirstPaths(*bounds)
+
+def findBestCombinations(firstPaths, firstTimes, pivotIx, secondPaths, secondTimes, points, maxSecs, topCount, processes=None):
+    # Returns the number of combinations within maxSecs, and the (first, second) index pairs of the best,
+    # in the order of decreasing points per second and then of the first and second paths
+    data = CombinationData(firstPaths, firstTimes, pivotIx, secondPaths, secondTimes, points, maxSecs, topCount)
+    setSharedData(data)
+    processes = processes or multiprocessing.cpu_count()
+    pool = None
+    if processes > 1 and len(firstPaths) * len(secondPaths) >= minPoolCombinations:
+        try:
+            pool = multiprocessing.Pool(processes, initializer=setSharedData, initargs=(data,))
+        except (ImportError, OSError): # no working multiprocessing here, so score them all in this process
+            pass
+    if pool is None:
+        count, best = scoreChunk((0, len(firstPaths)))
+    else:
+        chunkSize = max(1, len(firstPaths) / (processes * 4))
+        chunks = [ (start, min(start + chunkSize, len(firstPaths))) for start in range(0, len(firstPaths), chunkSize) ]
+        try:
+            results = pool.map(scoreChunk, chunks)
+        finally:
+            pool.close()
+            pool.join()
+        count, best = 0, []
+        for chunkCount, chunkBest in results:
+            count += chunkCount
+            best = mergeBest(best, chunkBest, topCount)
+    setSharedData(None)
+    return count, [ (i, int(j)) for _, i, j in best ]
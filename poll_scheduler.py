@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+# Chooses which zones to fetch in each poll when there is a fixed budget of zones per poll.
+# Each zone's takeover rate is estimated from the takeovers already logged for it, and zones are
+# picked in order of how likely they are to have been taken since they were last polled.
+# Every zone is still polled at least once per maxInterval so quiet zones aren't forgotten.
+#
+# A poll only ever sees the latest takeover of a zone, so if a zone was taken k times since the last
+# poll, k - 1 of those are missed. With a rate r and gap g the expected number missed is
+# r*g - (1 - exp(-r*g)), which is what the missed metric adds up.
+
+import os, math
+from pprint import pprint
+import takeover_log
+
+class PollScheduler:
+    priorTakeovers = 1.0
+    priorSecs = 7 * 24 * 3600.0
+    def __init__(self, budget, maxInterval):
+        self.budget = budget
+        self.maxInterval = maxInterval
+        self.takeoverCounts = {}
+        self.firstTakeovers = {}
+        self.lastPolled = {}
+        self.expectedTakeovers = 0.0
+        self.expectedMissed = 0.0
+
+    def readHistory(self, fileName):
+        for zoneId, epoch, _ in takeover_log.iterRecords(fileName):
+            if epoch:
+                self.addTakeover(zoneId, epoch)
+
+    def addTakeover(self, zoneId, epoch):
+        self.takeoverCounts[zoneId] = self.takeoverCounts.get(zoneId, 0) + 1
+        self.firstTakeovers[zoneId] = min(epoch, self.firstTakeovers.get(zoneId, epoch))
+
+    def getRate(self, zoneId, now):
+        # Takeovers per second, shrunk towards one a week for zones we know little about
+        span = max(now - self.firstTakeovers.get(zoneId, now), 0)
+        return (self.takeoverCounts.get(zoneId, 0) + self.priorTakeovers) / (span + self.priorSecs)
+
+    def getGap(self, zoneId, now):
+        return now - self.lastPolled.get(zoneId, now - self.maxInterval)
+
+    def getChangeProbability(self, zoneId, now):
+        return 1 - math.exp(-self.getRate(zoneId, now) * self.getGap(zoneId, now))
+
+    def getExpectedMissed(self, zoneId, now):
+        expected = self.getRate(zoneId, now) * self.getGap(zoneId, now)
+        return expected - (1 - math.exp(-expected))
+
+    def chooseZones(self, zoneIds, now):
+        if self.budget is None or len(zoneIds) <= self.budget:
+            return list(zoneIds)
+        overdue = [ zoneId for zoneId in zoneIds if self.getGap(zoneId, now) >= self.maxInterval ]
+        overdue.sort(key=lambda zoneId: self.getGap(zoneId, now), reverse=True)
+        chosen = overdue[:self.budget]
+        if len(chosen) < self.budget:
+            chosenSet = set(chosen)
+            others = [ zoneId for zoneId in zoneIds if zoneId not in chosenSet ]
+            others.sort(key=lambda zoneId: self.getChangeProbability(zoneId, now), reverse=True)
+            chosen += others[:self.budget - len(chosen)]
+        return chosen
+
+    def recordPoll(self, zoneIds, newRecords, now):
+        for zoneId in zoneIds:
+            self.expectedTakeovers += self.getRate(zoneId, now) * self.getGap(zoneId, now)
+            self.expectedMissed += self.getExpectedMissed(zoneId, now)
+            self.lastPolled[zoneId] = now
+        for zoneId, epoch, _ in newRecords:
+            if epoch:
+                self.addTakeover(zoneId, epoch)
+
+    def getMissedFraction(self):
+        return self.expectedMissed / self.expectedTakeovers if self.expectedTakeovers else 0.0
+
+    def describeMissed(self, zoneIds, now):
+        outstanding = sum((self.getExpectedMissed(zoneId, now) for zoneId in zoneIds))
+        return "Expect to have missed " + str(round(self.expectedMissed, 1)) + " of " + str(round(self.expectedTakeovers, 1)) + \
+            " takeovers (" + str(round(100 * self.getMissedFraction(), 1)) + "%), " + str(round(outstanding, 1)) + " more since last polled"
+
+    def readState(self, fileName):
+        if os.path.isfile(fileName):
+            state = eval(open(fileName).read())
+            self.lastPolled = state["lastPolled"]
+            self.expectedTakeovers = state["expectedTakeovers"]
+            self.expectedMissed = state["expectedMissed"]
+
+    def writeState(self, fileName):
+        state = { "lastPolled" : self.lastPolled, "expectedTakeovers" : self.expectedTakeovers, "expectedMissed" : self.expectedMissed }
+        with open(fileName, "w") as f:
+            pprint(state, f)
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+
+# Persistent state for turf_report.py, so that each run only folds in the takeovers
+# appended to the binary log since the last run.
+# Rule periods are kept per zone as (userId, startEpoch, endEpoch) in UTC, along with the
+# current owner of each zone and running totals of the points from completed periods.
+
+import takeover_log, pickled_state
+
+class ReportCheckpoint(pickled_state.PickledState):
+    version = 1
+    def __init__(self, fileName):
+        pickled_state.PickledState.__init__(self)
+        self.fileName = fileName
+        self.recordCount = 0
+        self.firstRecord = None
+        self.periodsByZone = {}
+        self.currentOwners = {}
+        self.pointTotals = {}
+        self.changed = False
+
+    @classmethod
+    def getCheckpointFile(cls, fileName):
+        return fileName + ".checkpoint"
+
+    @classmethod
+    def load(cls, fileName):
+        checkpoint = cls.loadPickle(cls.getCheckpointFile(fileName))
+        if checkpoint is not None and not takeover_log.isReplaced(fileName, checkpoint.recordCount, checkpoint.firstRecord):
+            checkpoint.fileName = fileName
+            checkpoint.changed = False
+            return checkpoint
+        return cls(fileName)
+
+    def update(self, staticData):
+        for record in takeover_log.iterRecords(self.fileName, self.recordCount):
+            if self.recordCount == 0:
+                self.firstRecord = record
+            self.recordCount += 1
+            self.changed = True
+            self.addRecord(staticData, *record)
+
+    def addRecord(self, staticData, zoneId, epoch, ownerId):
+        periods = self.periodsByZone.setdefault(zoneId, [])
+        if not epoch:
+            return
+        current = self.currentOwners.get(zoneId)
+        if current is not None:
+            prevOwnerId, prevEpoch = current
+            if prevOwnerId == ownerId:
+                return
+            periods.append((prevOwnerId, prevEpoch, epoch))
+            takepoints, pph = staticData.get(zoneId)[1:3]
+            self.addPoints(zoneId, takepoints, pph, prevEpoch, epoch)
+        self.currentOwners[zoneId] = ownerId, epoch
+
+    def calculatePoints(self, takepoints, pph, startEpoch, endEpoch):
+        return takepoints + int((endEpoch - startEpoch) / 3600.0 * pph)
+
+    def addPoints(self, zoneId, takepoints, pph, startEpoch, endEpoch):
+        points = self.calculatePoints(takepoints, pph, startEpoch, endEpoch)
+        totals = self.pointTotals.get(zoneId)
+        if totals is None or totals[:2] != (takepoints, pph):
+            totals = self.recalculateTotals(zoneId, takepoints, pph, self.periodsByZone[zoneId][:-1])
+        self.pointTotals[zoneId] = takepoints, pph, totals[2] + points, totals[3] + 1
+
+    def recalculateTotals(self, zoneId, takepoints, pph, periods):
+        allPoints = [ self.calculatePoints(takepoints, pph, startEpoch, endEpoch) for _, startEpoch, endEpoch in periods ]
+        return takepoints, pph, sum(allPoints), len(allPoints)
+
+    def getPointTotals(self, zoneId, takepoints, pph):
+        # Zone values hardly ever change, but if they have the stored totals are useless
+        totals = self.pointTotals.get(zoneId)
+        if totals is None or totals[:2] != (takepoints, pph):
+            totals = self.recalculateTotals(zoneId, takepoints, pph, self.periodsByZone.get(zoneId, []))
+            self.pointTotals[zoneId] = totals
+            self.changed = True
+        return totals[2:]
+
+    def save(self):
+        if not self.changed:
+            return
+        self.savePickle(self.getCheckpointFile(self.fileName))
+        self.changed = False
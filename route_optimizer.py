@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+
+# Orienteering-style search for the route finder: choose an ordered list of zones to visit between
+# the start and end zones that gives the most points per second within the maximum time.
+# Travel between waypoints follows the shortest paths, and zones passed on the way score as well.
+#
+# A beam search builds routes by inserting one zone at a time at its cheapest position, and the best
+# route found is then improved by local search (dropping, swapping, replacing and reordering zones).
+# Both stop when the time budget or iteration budget runs out, returning the best route so far.
+# Given a search_trace.SearchTrace, each beam level and each improvement is recorded at level 1, and every
+# route evaluated at level 2, with zones as the zone ids given.
+
+import time
+import search_trace
+
+class RouteOptimizer:
+    def __init__(self, shortestPaths, getPathIndices, points, startIx, endIx, maxSecs, timesToEnd=None, trace=None, zoneIds=None):
+        self.shortestPaths = shortestPaths
+        self.timesToEnd = timesToEnd if timesToEnd is not None else [ row[endIx] for row in shortestPaths ]
+        self.getPathIndices = getPathIndices
+        self.points = points
+        self.startIx = startIx
+        self.endIx = endIx
+        self.maxSecs = maxSecs
+        self.segments = {}
+        self.evaluations = 0
+        self.deadline = None
+        self.maxEvaluations = None
+        self.trace = trace or search_trace.SearchTrace()
+        self.traceRoutes = self.trace.isEnabled(2)
+        self.zoneIds = zoneIds
+
+    def getZoneIds(self, route):
+        return [ self.zoneIds[ix] for ix in route ] if self.zoneIds is not None else list(route)
+
+    def traceRoute(self, kind, route, score):
+        self.trace.record(1, kind, self.getZoneIds(route), score[0], score[1], self.evaluations)
+
+    def getSegment(self, source, target):
+        key = source, target
+        if key not in self.segments:
+            self.segments[key] = tuple(self.getPathIndices(source, target)) + (target,)
+        return self.segments[key]
+
+    def getTime(self, route):
+        stops = (self.startIx,) + route + (self.endIx,)
+        return sum((self.shortestPaths[stops[i]][stops[i + 1]] for i in range(len(stops) - 1)))
+
+    def getPoints(self, route):
+        stops = (self.startIx,) + route + (self.endIx,)
+        visited = set()
+        for i in range(len(stops) - 1):
+            visited.update(self.getSegment(stops[i], stops[i + 1]))
+        return sum((self.points[ix] for ix in visited))
+
+    def evaluate(self, route):
+        # Returns (points per second, time), or None if the route is too long
+        self.evaluations += 1
+        totalTime = self.getTime(route)
+        if totalTime > self.maxSecs:
+            if self.traceRoutes:
+                self.trace.record(2, "route", self.getZoneIds(route), None, totalTime)
+            return
+        pps = float(self.getPoints(route)) / totalTime if totalTime else 0.0
+        if self.traceRoutes:
+            self.trace.record(2, "route", self.getZoneIds(route), pps, totalTime)
+        return pps, totalTime
+
+    def outOfBudget(self):
+        return (self.deadline is not None and time.time() > self.deadline) or \
+            (self.maxEvaluations is not None and self.evaluations >= self.maxEvaluations)
+
+    def getCandidates(self):
+        candidates = []
+        for ix in range(len(self.points)):
+            if ix in (self.startIx, self.endIx) or not self.points[ix]:
+                continue
+            if self.shortestPaths[self.startIx][ix] + self.timesToEnd[ix] <= self.maxSecs:
+                candidates.append(ix)
+        return candidates
+
+    def getInsertionCost(self, route, ix, position):
+        stops = (self.startIx,) + route + (self.endIx,)
+        before, after = stops[position], stops[position + 1]
+        return self.shortestPaths[before][ix] + self.shortestPaths[ix][after] - self.shortestPaths[before][after]
+
+    def insertCheapest(self, route, ix):
+        position = min(range(len(route) + 1), key=lambda pos: self.getInsertionCost(route, ix, pos))
+        return route[:position] + (ix,) + route[position:]
+
+    def beamSearch(self, candidates, beamWidth):
+        best = (), self.evaluate(())
+        if best[1] is None:
+            return best
+        beam = [ best ]
+        while beam and not self.outOfBudget():
+            nextBeam = {}
+            for route, _ in beam:
+                if self.outOfBudget():
+                    break
+                for ix in candidates:
+                    if ix in route:
+                        continue
+                    newRoute = self.insertCheapest(route, ix)
+                    key = frozenset(newRoute)
+                    if key in nextBeam:
+                        continue
+                    score = self.evaluate(newRoute)
+                    if score is not None:
+                        nextBeam[key] = newRoute, score
+                    if self.outOfBudget():
+                        break
+            beam = sorted(nextBeam.values(), key=lambda (r, s): s[0], reverse=True)[:beamWidth]
+            if beam:
+                self.traceRoute("beam", *beam[0])
+            if beam and beam[0][1][0] > best[1][0]:
+                best = beam[0]
+        return best
+
+    def getNeighbours(self, route, candidates):
+        for i in range(len(route)):
+            yield route[:i] + route[i + 1:]
+        for i in range(len(route)):
+            for j in range(i + 1, len(route)):
+                yield route[:i] + route[i:j + 1][::-1] + route[j + 1:]
+        unused = [ ix for ix in candidates if ix not in route ]
+        for ix in unused:
+            yield self.insertCheapest(route, ix)
+            for i in range(len(route)):
+                yield route[:i] + (ix,) + route[i + 1:]
+
+    def localSearch(self, best, candidates):
+        improved = best[1] is not None
+        while improved and not self.outOfBudget():
+            improved = False
+            for route in self.getNeighbours(best[0], candidates):
+                score = self.evaluate(route)
+                if score is not None and score[0] > best[1][0]:
+                    best = route, score
+                    self.traceRoute("improved", *best)
+                    improved = True
+                    break
+                if self.outOfBudget():
+                    break
+        return best
+
+    def optimize(self, searchSecs=None, maxEvaluations=None, beamWidth=10):
+        self.deadline = time.time() + searchSecs if searchSecs is not None else None
+        self.maxEvaluations = maxEvaluations
+        candidates = self.getCandidates()
+        self.trace.record(1, "optimize", self.getZoneIds((self.startIx, self.endIx)), self.maxSecs, len(candidates))
+        best = self.beamSearch(candidates, beamWidth)
+        if best[1] is not None:
+            self.traceRoute("beam best", *best)
+        best = self.localSearch(best, candidates)
+        self.trace.record(1, "stopped", "budget" if self.outOfBudget() else "done", self.evaluations)
+        return best
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+
+# Opt-in profiling of a run of turf_report.py or get_turf_data.py: the time spent in each named stage,
+# how many API requests were made and how many bytes they sent and received, and the peak resident memory.
+# Each run appends one JSON line to the profile file, so that polls run from cron can be followed over time.
+# Turned on with --profile, or by setting TURF_PROFILE to the file to write to. When off, stages cost nothing.
+
+import os, sys, time, json, resource, atexit, threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+envVariable = "TURF_PROFILE"
+defaultName = "turf_profile.jsonl"
+profile = None
+
+def getPeakMb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+class RunProfile:
+    def __init__(self, fileName, script):
+        self.fileName = fileName
+        self.script = script
+        self.startTime = time.time()
+        self.stages = OrderedDict() # name -> [secs, calls, peak MB at the end]
+        self.requests = 0
+        self.bytesSent = 0
+        self.bytesReceived = 0
+        self.lock = threading.Lock() # requests are counted from several threads
+
+    def addStage(self, name, secs):
+        stage = self.stages.setdefault(name, [ 0.0, 0, 0.0 ])
+        stage[0] += secs
+        stage[1] += 1
+        stage[2] = getPeakMb()
+
+    def addRequest(self, bytesSent, bytesReceived):
+        with self.lock:
+            self.requests += 1
+            self.bytesSent += bytesSent
+            self.bytesReceived += bytesReceived
+
+    def getSummary(self):
+        stages = [ OrderedDict([ ("name", name), ("secs", round(secs, 3)), ("calls", calls), ("peakMb", round(peakMb, 1)) ])
+                   for name, (secs, calls, peakMb) in self.stages.items() ]
+        return OrderedDict([ ("script", self.script), ("args", sys.argv[1:]), ("start", int(self.startTime)),
+                             ("secs", round(time.time() - self.startTime, 3)), ("stages", stages),
+                             ("requests", self.requests), ("bytesSent", self.bytesSent),
+                             ("bytesReceived", self.bytesReceived), ("peakMb", round(getPeakMb(), 1)) ])
+
+    def write(self):
+        with open(self.fileName, "a") as f:
+            f.write(json.dumps(self.getSummary()) + "\n")
+
+def start(script, fileName, currDir):
+    # fileName is the --profile argument: None if not given, or "" to use the default file
+    global profile
+    if fileName is None:
+        fileName = os.getenv(envVariable)
+    if fileName is not None:
+        profile = RunProfile(fileName or os.path.join(currDir, defaultName), script)
+        atexit.register(finish)
+
+def finish():
+    global profile
+    if profile:
+        profile.write()
+        profile = None
+
+@contextmanager
+def stage(name):
+    if profile is None:
+        yield
+        return
+    startTime = time.time()
+    try:
+        yield
+    finally:
+        if profile:
+            profile.addStage(name, time.time() - startTime)
+
+def countRequest(bytesSent, bytesReceived):
+    if profile:
+        profile.addRequest(bytesSent, bytesReceived)
@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+
+# Trace of what the route finder tried, for finding out why a search did what it did.
+# Records are small tuples kept in a bounded ring buffer while searching, and are only written out,
+# one JSON list per line, once the search is over. Nothing is recorded at level 0, level 1 records
+# each step of the search, such as a pivot sub-search and how many paths it found, and level 2 also records
+# every path or route tried.
+
+import json
+from collections import deque
+
+class SearchTrace:
+    def __init__(self, level=0, maxRecords=100000):
+        self.level = level
+        self.records = deque(maxlen=maxRecords)
+        self.dropped = 0
+
+    def isEnabled(self, level):
+        return self.level >= level
+
+    def record(self, level, *fields):
+        if self.level >= level:
+            if len(self.records) == self.records.maxlen:
+                self.dropped += 1
+            self.records.append(fields)
+
+    def write(self, fileName):
+        if not self.level:
+            return
+        with open(fileName, "w") as f:
+            if self.dropped:
+                f.write(json.dumps([ "dropped", self.dropped ]) + "\n")
+            for fields in self.records:
+                f.write(json.dumps(fields) + "\n")
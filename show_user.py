@@ -1,11 +1,11 @@
 #!/usr/bin/env python
 
-import requests, os, sys
+import os, sys
 from pprint import pprint
+import turf_api
 
 def get_user_info(user):
-    r = requests.post('http://api.turfgame.com/v4/users', json=[{"name" : user}])
-    return r.json()[0]
+    return turf_api.get_users_from_list("name", [ user ])[0]
 
 userName = sys.argv[1]
 userInfo = get_user_info(userName)
@@ -1,13 +1,8 @@
 #!/usr/bin/env python
 
-import requests, os, sys
+import os, sys
 from pprint import pprint
-
-def get_zones_from_list(dataType, info):
-    zoneRequestData = [{ dataType : zdat } for zdat in info ]
-    r = requests.post('http://api.turfgame.com/v4/zones', json=zoneRequestData)
-    return r.json(), r.encoding
-
+from turf_api import get_zones_from_list
 
 zoneName = sys.argv[1]
 if zoneName.isdigit():
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+
+# Grid index over zone coordinates for finding zones near a point.
+# Zones are bucketed into cells of a fixed size in degrees, so a query only looks at the
+# cells overlapping its area and then checks the real (haversine) distance.
+
+import math
+
+earthRadiusKm = 6371.0
+kmPerDegree = math.pi * earthRadiusKm / 180
+
+def haversine(lat1, long1, lat2, long2):
+    dlat = math.radians(lat2 - lat1)
+    dlong = math.radians(long2 - long1)
+    a = math.sin(dlat / 2) ** 2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlong / 2) ** 2
+    return 2 * earthRadiusKm * math.asin(min(1.0, math.sqrt(a)))
+
+class SpatialIndex:
+    def __init__(self, cellDegrees=0.01):
+        self.cellDegrees = cellDegrees
+        self.cells = {}
+        self.positions = {}
+
+    @classmethod
+    def fromStaticData(cls, staticData):
+        index = cls()
+        for zoneId, (name, takepoints, pph, longitude, latitude) in staticData.items():
+            index.add(zoneId, latitude, longitude)
+        return index
+
+    def getCell(self, lat, long):
+        return int(math.floor(lat / self.cellDegrees)), int(math.floor(long / self.cellDegrees))
+
+    def add(self, zoneId, lat, long):
+        self.positions[zoneId] = lat, long
+        self.cells.setdefault(self.getCell(lat, long), []).append(zoneId)
+
+    def iterCells(self, minLat, minLong, maxLat, maxLong):
+        minRow, minCol = self.getCell(minLat, minLong)
+        maxRow, maxCol = self.getCell(maxLat, maxLong)
+        if (maxRow - minRow + 1) * (maxCol - minCol + 1) > len(self.cells):
+            cells = [ cell for cell in self.cells.keys() if minRow <= cell[0] <= maxRow and minCol <= cell[1] <= maxCol ]
+        else:
+            cells = [ (row, col) for row in range(minRow, maxRow + 1) for col in range(minCol, maxCol + 1) ]
+        for cell in cells:
+            for zoneId in self.cells.get(cell, []):
+                yield zoneId
+
+    def inBox(self, minLat, minLong, maxLat, maxLong):
+        found = []
+        for zoneId in self.iterCells(minLat, minLong, maxLat, maxLong):
+            lat, long = self.positions[zoneId]
+            if minLat <= lat <= maxLat and minLong <= long <= maxLong:
+                found.append(zoneId)
+        return found
+
+    def withDistances(self, lat, long, radiusKm):
+        latDelta = radiusKm / kmPerDegree
+        longDelta = radiusKm / (kmPerDegree * max(math.cos(math.radians(lat)), 0.01))
+        found = []
+        for zoneId in self.iterCells(lat - latDelta, long - longDelta, lat + latDelta, long + longDelta):
+            distance = haversine(lat, long, *self.positions[zoneId])
+            if distance <= radiusKm:
+                found.append((distance, zoneId))
+        return found
+
+    def withinRadius(self, lat, long, radiusKm):
+        return [ zoneId for _, zoneId in sorted(self.withDistances(lat, long, radiusKm)) ]
+
+    def nearest(self, lat, long, count):
+        count = min(count, len(self.positions))
+        radiusKm = self.cellDegrees * kmPerDegree
+        while True:
+            found = self.withDistances(lat, long, radiusKm)
+            # Everything within the radius has been found, so if there are enough of them they are the nearest
+            if len(found) >= count or radiusKm > 2 * math.pi * earthRadiusKm:
+                return [ zoneId for _, zoneId in sorted(found)[:count] ]
+            radiusKm *= 2
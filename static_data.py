@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+
+# Static values of the zones: (name, takeoverPoints, pointsPerHour, longitude, latitude) by zone id.
+# They hardly ever change, so polls only write them out when some zone's values have. Each change is appended to
+# static_zone_changes.txt with the old and new values, the version goes up, and static_zone_data.txt is rewritten
+# along with a pickled snapshot that the reports load instead of evaluating the text.
+# If static_zone_data.txt is newer than the snapshot, it has been written by something else and is read instead.
+# Only the pollers (get_turf_data.py and turf_daemon.py) then count that as a new version and rewrite the snapshot:
+# reports just read the text, so that the files only ever change while polling.
+
+import os, time, cPickle
+from pprint import pprint
+import pickled_state
+
+textName = "static_zone_data.txt"
+snapshotName = "static_zone_data.pickle"
+changeLogName = "static_zone_changes.txt"
+
+class StaticZoneData:
+    def __init__(self, dirName):
+        self.dirName = dirName
+        self.version = 0
+        self.zones = {}
+        self.changes = []
+
+    def getFile(self, name):
+        return os.path.join(self.dirName, name)
+
+    @classmethod
+    def load(cls, dirName, poller=False):
+        data = cls(dirName)
+        textFile, snapshotFile = data.getFile(textName), data.getFile(snapshotName)
+        if os.path.isfile(snapshotFile):
+            with open(snapshotFile, "rb") as f:
+                data.version, data.zones = cPickle.load(f)
+        if os.path.isfile(textFile) and (not os.path.isfile(snapshotFile) or os.path.getmtime(textFile) > os.path.getmtime(snapshotFile)):
+            data.zones = eval(open(textFile).read())
+            if poller:
+                data.version += 1
+                data.saveSnapshot()
+        return data
+
+    def update(self, zoneId, values):
+        oldValues = self.zones.get(zoneId)
+        if oldValues != values:
+            self.changes.append((zoneId, oldValues, values))
+            self.zones[zoneId] = values
+
+    def save(self):
+        # Returns whether anything had changed
+        if not self.changes:
+            return False
+        self.version += 1
+        now = int(time.time())
+        with open(self.getFile(changeLogName), "a") as f:
+            for zoneId, oldValues, values in self.changes:
+                f.write(repr((self.version, now, zoneId, oldValues, values)) + "\n")
+        with open(self.getFile(textName), "w") as f:
+            pprint(self.zones, f)
+        self.saveSnapshot() # after the text, so that it's newer
+        self.changes = []
+        return True
+
+    def saveSnapshot(self):
+        pickled_state.savePickle((self.version, self.zones), self.getFile(snapshotName))
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+# Writes made-up turf data in the same files get_turf_data.py and turf_daemon.py produce, so that
+# turf_report.py can be run and measured without the turf API: static_zone_data.txt, curr_turf_data.bin,
+# archived rounds as <end date>_turf_data.bin, plus turf_config.txt and user_directory.json for the users.
+#
+# Zones are spread evenly over a square around home, at a fixed density so bigger sets cover a bigger area.
+# Users go on rides, taking a zone and cycling on to one of the nearest zones, and a few users make most
+# of the rides. User 1 is the configured user.
+
+import os, math, random, time, argparse
+from datetime import datetime
+from pprint import pprint
+import takeover_log, spatial_index, user_directory
+
+homeLatitude, homeLongitude = 57.7, 11.97
+zonesPerSqKm = 4.0
+cyclingKmh = 15.0
+
+def makeStaticData(zoneCount, rng):
+    sideKm = math.sqrt(zoneCount / zonesPerSqKm)
+    kmPerLongitude = 111.32 * math.cos(math.radians(homeLatitude))
+    staticData = {}
+    for zoneId in range(1, zoneCount + 1):
+        latitude = homeLatitude + (rng.random() - 0.5) * sideKm / 111.32
+        longitude = homeLongitude + (rng.random() - 0.5) * sideKm / kmPerLongitude
+        staticData[zoneId] = u"Zone" + str(zoneId), rng.choice([ 65, 125, 185, 250 ]), rng.choice([ 1, 2, 3, 4 ]), longitude, latitude
+    return staticData
+
+def makeNeighbours(staticData, count=6):
+    index = spatial_index.SpatialIndex.fromStaticData(staticData)
+    neighbours = {}
+    for zoneId, info in staticData.items():
+        longitude, latitude = info[3:5]
+        nearest = [ otherId for otherId in index.nearest(latitude, longitude, count + 1) if otherId != zoneId ]
+        neighbours[zoneId] = [ (otherId, spatial_index.haversine(latitude, longitude, staticData[otherId][4], staticData[otherId][3]))
+                               for otherId in nearest ]
+    return neighbours
+
+def makeRides(staticData, neighbours, userCount, takeoversPerZoneDay, startEpoch, endEpoch, rng):
+    # Returns takeover records (zoneId, epoch, userId) in time order
+    zoneIds = sorted(staticData.keys())
+    userWeights = [ 1.0 / rank for rank in range(1, userCount + 1) ]
+    totalWeight = sum(userWeights)
+    takeoverCount = int(len(zoneIds) * takeoversPerZoneDay * (endEpoch - startEpoch) / 86400.0)
+    records = []
+    while len(records) < takeoverCount:
+        pick = rng.random() * totalWeight
+        userId = 1
+        while pick > userWeights[userId - 1] and userId < userCount:
+            pick -= userWeights[userId - 1]
+            userId += 1
+        epoch = rng.randint(startEpoch, endEpoch)
+        zoneId = rng.choice(zoneIds)
+        for step in range(rng.randint(3, 20)):
+            if epoch >= endEpoch:
+                break
+            records.append((zoneId, epoch, userId))
+            zoneId, distanceKm = rng.choice(neighbours[zoneId])
+            epoch += int(distanceKm / cyclingKmh * 3600 * rng.uniform(1.0, 1.5)) + rng.randint(30, 120)
+    records.sort(key=lambda record: record[1])
+    return records
+
+def writeRound(fileName, staticData, records):
+    if os.path.isfile(fileName):
+        os.remove(fileName)
+    # Every zone is monitored from the start, whether or not it's taken
+    takeover_log.appendRecords(fileName, [ (zoneId, 0, 0) for zoneId in sorted(staticData.keys()) ])
+    takeover_log.appendRecords(fileName, records)
+
+def writeSandbox(dirName, zoneCount=1000, userCount=200, takeoversPerZoneDay=1.0, days=30, rounds=1, seed=1):
+    # Writes the current round ending now and the given number of earlier rounds, and returns the takeover count
+    rng = random.Random(seed)
+    if not os.path.isdir(dirName):
+        os.makedirs(dirName)
+    staticData = makeStaticData(zoneCount, rng)
+    neighbours = makeNeighbours(staticData)
+    now = int(time.time())
+    takeoverCount = 0
+    for roundNumber in range(rounds + 1):
+        endEpoch = now - roundNumber * days * 86400
+        records = makeRides(staticData, neighbours, userCount, takeoversPerZoneDay, endEpoch - days * 86400, endEpoch, rng)
+        if roundNumber == 0:
+            fileName = "curr_turf_data.bin"
+        else:
+            fileName = datetime.utcfromtimestamp(endEpoch).strftime("%Y-%m-%d") + "_turf_data.bin"
+        writeRound(os.path.join(dirName, fileName), staticData, records)
+        takeoverCount += len(records)
+
+    with open(os.path.join(dirName, "static_zone_data.txt"), "w") as f:
+        pprint(staticData, f)
+    with open(os.path.join(dirName, "turf_config.txt"), "w") as f:
+        pprint({ "username" : "user1", "home_latitude" : homeLatitude, "home_longitude" : homeLongitude }, f)
+    directory = user_directory.UserDirectory(os.path.join(dirName, user_directory.defaultName))
+    for userId in range(1, userCount + 1):
+        directory.addUserInfo({ "id" : userId, "name" : u"user" + str(userId), "place" : userId }, now)
+    directory.save()
+    return takeoverCount
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Write synthetic turf data for testing turf_report.py')
+    parser.add_argument('directory', help='directory to write the data files to')
+    parser.add_argument('-z', '--zones', type=int, default=1000, help='number of zones')
+    parser.add_argument('-u', '--users', type=int, default=200, help='number of users')
+    parser.add_argument('-t', '--takeovers', type=float, default=1.0, help='takeovers per zone per day')
+    parser.add_argument('-d', '--days', type=int, default=30, help='length of each round in days')
+    parser.add_argument('-r', '--rounds', type=int, default=1, help='number of earlier rounds to archive')
+    parser.add_argument('-s', '--seed', type=int, default=1, help='random seed')
+    args = parser.parse_args()
+    count = writeSandbox(args.directory, args.zones, args.users, args.takeovers, args.days, args.rounds, args.seed)
+    print "Wrote", count, "takeovers for", args.zones, "zones to", args.directory
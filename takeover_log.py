@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+
+# Append-only binary store for zone takeovers, replacing the pprint'ed curr_turf_data.txt.
+# Each record is a fixed-width (zoneId, dateLastTaken, ownerId) triple with the date in UTC epoch seconds.
+# A record with date 0 and owner 0 just means "this zone is monitored" and carries no takeover.
+
+import struct, os, mmap, calendar
+from datetime import datetime
+
+recordFormat = struct.Struct("<IqI")
+recordSize = recordFormat.size
+
+def parseApiDate(dateStr):
+    dt = datetime.strptime(dateStr[:-5], "%Y-%m-%dT%H:%M:%S")
+    return calendar.timegm(dt.timetuple())
+
+def getLocalOffset():
+    # Seconds to add to the UTC epochs in the log to get local ones
+    offset = datetime.now() - datetime.utcnow()
+    return int(round(offset.total_seconds()))
+
+def readFirstRecord(fileName):
+    for record in iterRecords(fileName):
+        return record
+
+def isReplaced(fileName, recordCount, firstRecord):
+    # Logs only ever grow, so if one has shrunk or starts differently since it had the given records, it's been replaced
+    return countRecords(fileName) < recordCount or (recordCount > 0 and readFirstRecord(fileName) != firstRecord)
+
+def countRecords(fileName):
+    return os.path.getsize(fileName) // recordSize if os.path.isfile(fileName) else 0
+
+def iterRecords(fileName, startRecord=0):
+    count = countRecords(fileName)
+    if count <= startRecord:
+        return
+    with open(fileName, "rb") as f:
+        mm = mmap.mmap(f.fileno(), count * recordSize, access=mmap.ACCESS_READ)
+        try:
+            for i in xrange(startRecord, count):
+                yield recordFormat.unpack_from(mm, i * recordSize)
+        finally:
+            mm.close()
+
+def appendRecords(fileName, records):
+    with open(fileName, "ab") as f:
+        for zoneId, epoch, ownerId in records:
+            f.write(recordFormat.pack(zoneId, epoch, ownerId))
+
+def latestRecords(fileName):
+    latest = {}
+    for zoneId, epoch, ownerId in iterRecords(fileName):
+        if epoch or zoneId not in latest:
+            latest[zoneId] = epoch, ownerId
+    return latest
+
+def readLegacyZoneData(fileName):
+    zoneData = {}
+    for zoneId, takeoverInfo in eval(open(fileName).read()).items():
+        zoneData[zoneId] = [ (parseApiDate(dateStr), userId) for dateStr, userId in takeoverInfo ]
+    return zoneData
+
+def convertFile(txtFileName, binFileName):
+    records = []
+    for zoneId, takeoverInfo in sorted(readLegacyZoneData(txtFileName).items()):
+        if takeoverInfo:
+            records += [ (zoneId, epoch, userId) for epoch, userId in takeoverInfo ]
+        else:
+            records.append((zoneId, 0, 0))
+    if os.path.isfile(binFileName):
+        os.remove(binFileName)
+    appendRecords(binFileName, records)
+    return len(records)
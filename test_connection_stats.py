@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+
+import os, shutil, tempfile, unittest
+import connection_stats, takeover_log
+
+userId = 7
+otherUserId = 8
+
+def getJourneys(logFiles):
+    # Like turf_report.py's, from one takeover by the user to their next within 20 minutes
+    takeovers = sorted(((epoch, zoneId) for logFile in logFiles for zoneId, epoch, ownerId in takeover_log.iterRecords(logFile) if ownerId == userId))
+    return [ (prevZoneId, zoneId, prevEpoch, epoch) for (prevEpoch, prevZoneId), (epoch, zoneId) in zip(takeovers, takeovers[1:])
+             if epoch - prevEpoch <= 20 * 60 ]
+
+class ConnectionStatsTest(unittest.TestCase):
+    def setUp(self):
+        self.dirName = tempfile.mkdtemp()
+        self.logFile = os.path.join(self.dirName, "curr_turf_data.bin")
+        self.statsFile = os.path.join(self.dirName, "connection_stats", str(userId) + ".pickle")
+        self.archiveFiles = []
+
+    def tearDown(self):
+        shutil.rmtree(self.dirName)
+
+    def runReport(self, fileName):
+        stats = connection_stats.ConnectionStats.load(fileName, 0)
+        stats.checkLog(self.logFile, userId, self.archiveFiles)
+        for journey in getJourneys(self.archiveFiles + [ self.logFile ]):
+            stats.addJourney(*journey)
+        stats.save()
+        return stats
+
+    def getDurations(self, stats):
+        return dict(((pair, durations.durations) for pair, durations in stats.durationsByPair.items() if durations.durations))
+
+    def assertSameAsRebuild(self):
+        stats = self.runReport(self.statsFile)
+        rebuilt = self.runReport(os.path.join(self.dirName, "rebuilt.pickle"))
+        self.assertEqual(self.getDurations(stats), self.getDurations(rebuilt))
+        return stats
+
+    def testAppendsInOrder(self):
+        takeover_log.appendRecords(self.logFile, [ (1, 1000, userId), (2, 1300, userId), (3, 1600, userId) ])
+        self.assertSameAsRebuild()
+        takeover_log.appendRecords(self.logFile, [ (1, 1900, userId), (2, 1900, otherUserId), (4, 2200, userId) ])
+        stats = self.assertSameAsRebuild()
+        self.assertEqual(stats.getDurations(3, 1).durations, [ 300 ])
+
+    def testAppendsOutOfOrder(self):
+        takeover_log.appendRecords(self.logFile, [ (1, 1000, userId), (2, 1300, userId), (3, 1900, userId) ])
+        self.assertSameAsRebuild()
+        # Zone 4 was polled late, and was taken between zones 2 and 3
+        takeover_log.appendRecords(self.logFile, [ (4, 1600, userId), (1, 2200, userId) ])
+        stats = self.assertSameAsRebuild()
+        self.assertEqual(stats.getDurations(2, 3).durations, [])
+        self.assertEqual(stats.getDurations(4, 3).durations, [ 300 ])
+
+    def testOtherUsersOutOfOrder(self):
+        takeover_log.appendRecords(self.logFile, [ (1, 1000, userId), (2, 1300, userId) ])
+        self.assertSameAsRebuild()
+        takeover_log.appendRecords(self.logFile, [ (5, 900, otherUserId), (3, 1600, userId) ])
+        stats = connection_stats.ConnectionStats.load(self.statsFile, 0)
+        stats.checkLog(self.logFile, userId)
+        self.assertEqual(self.getDurations(stats), { (1, 2) : [ 300 ] })
+        self.assertSameAsRebuild()
+
+    def testNewRound(self):
+        takeover_log.appendRecords(self.logFile, [ (1, 1000, userId), (2, 1300, userId), (3, 1600, userId) ])
+        self.assertSameAsRebuild()
+        os.remove(self.logFile)
+        takeover_log.appendRecords(self.logFile, [ (1, 500, userId), (2, 800, userId) ])
+        stats = self.assertSameAsRebuild()
+        self.assertEqual(self.getDurations(stats), { (1, 2) : [ 300 ] })
+
+    def testLogReplaced(self):
+        takeover_log.appendRecords(self.logFile, [ (1, 1000, userId), (2, 1300, userId), (3, 1600, userId) ])
+        self.assertSameAsRebuild()
+        os.remove(self.logFile)
+        takeover_log.appendRecords(self.logFile, [ (1, 5000, userId), (3, 5600, userId), (2, 5900, userId) ])
+        stats = self.assertSameAsRebuild()
+        self.assertEqual(self.getDurations(stats), { (1, 3) : [ 600 ], (3, 2) : [ 300 ] })
+
+    def testArchiveAdded(self):
+        takeover_log.appendRecords(self.logFile, [ (1, 10000, userId), (2, 10300, userId) ])
+        self.assertSameAsRebuild()
+        archiveFile = os.path.join(self.dirName, "2015-06-01_turf_data.bin")
+        takeover_log.appendRecords(archiveFile, [ (3, 1000, userId), (4, 1600, userId) ])
+        self.archiveFiles.append(archiveFile)
+        stats = self.assertSameAsRebuild()
+        self.assertEqual(self.getDurations(stats), { (1, 2) : [ 300 ], (3, 4) : [ 600 ] })
+        takeover_log.appendRecords(archiveFile, [ (1, 1900, userId) ])
+        stats = self.assertSameAsRebuild()
+        self.assertEqual(stats.getDurations(4, 1).durations, [ 300 ])
+
+    def testOldVersion(self):
+        takeover_log.appendRecords(self.logFile, [ (1, 1000, userId), (2, 1300, userId) ])
+        stats = self.runReport(self.statsFile)
+        stats.savedVersion -= 1
+        stats.changed = True
+        stats.save()
+        self.assertEqual(connection_stats.ConnectionStats.load(self.statsFile, 0).durationsByPair, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
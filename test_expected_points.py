@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+
+import os, shutil, tempfile, unittest
+from glob import glob
+import synthetic_round, static_data, turf_report
+
+class ExpectedPointsTest(unittest.TestCase):
+    def setUp(self):
+        self.dirName = tempfile.mkdtemp()
+        synthetic_round.writeSandbox(self.dirName, zoneCount=600, userCount=50, days=7, rounds=1)
+        # Finished rounds are named by their end date, relative to the current directory
+        self.origDir = os.getcwd()
+        os.chdir(self.dirName)
+        self.staticData = static_data.StaticZoneData.load(self.dirName).zones
+        # Some zones with an average from the previous round, and some without
+        self.prevAvgData = dict(((zoneId, 50 + zoneId % 150) for zoneId in self.staticData if zoneId % 3 == 0))
+        turf_report.Zone.allZones.clear()
+        self.origThreshold = turf_report.batchZoneThreshold
+
+    def tearDown(self):
+        turf_report.batchZoneThreshold = self.origThreshold
+        turf_report.Zone.allZones.clear()
+        os.chdir(self.origDir)
+        shutil.rmtree(self.dirName)
+
+    def getExpectedPoints(self, threshold, finished, forUserNow=None):
+        fileName = glob("*-*-*_turf_data.bin")[0] if finished else "curr_turf_data.bin"
+        userIds, _, rulePeriodsByZone, pointTotalsByZone = turf_report.parseZoneData(fileName, finished, None, self.staticData, self.prevAvgData)
+        for zone in rulePeriodsByZone:
+            zone.expectedPoints = None
+        turf_report.batchZoneThreshold = threshold
+        turf_report.setAllExpectedPoints(rulePeriodsByZone, forUserNow and userIds[forUserNow], pointTotalsByZone)
+        return dict(((zone.zoneId, zone.expectedPoints) for zone in rulePeriodsByZone))
+
+    def assertSameBothWays(self, finished, forUserNow=None):
+        perZone = self.getExpectedPoints(len(self.staticData) + 1, finished, forUserNow)
+        batch = self.getExpectedPoints(1, finished, forUserNow)
+        self.assertEqual(len(perZone), len(self.staticData))
+        self.assertTrue(any(points is not None for points in perZone.values()))
+        self.assertEqual(perZone, batch)
+
+    def testCurrentRound(self):
+        self.assertSameBothWays(False)
+
+    def testCurrentRoundForUser(self):
+        self.assertSameBothWays(False, forUserNow=1)
+
+    def testFinishedRound(self):
+        self.assertSameBothWays(True)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+
+import shutil, random, tempfile, unittest
+import numpy
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+import path_cache
+
+zoneCount = 150
+
+def makeGraph(edges):
+    keys = sorted(edges)
+    graph = csr_matrix(([ float(edges[key]) for key in keys ], ([ i for i, _ in keys ], [ j for _, j in keys ])), shape=(zoneCount, zoneCount))
+    graph.sort_indices()
+    return graph
+
+class ShortestPathCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cacheDir = tempfile.mkdtemp()
+        self.rng = random.Random(1)
+        self.zoneIds = range(1000, 1000 + zoneCount)
+        self.edges = {}
+        for i in range(zoneCount):
+            for j in self.rng.sample(range(zoneCount), 4):
+                if i != j:
+                    self.edges[i, j] = self.edges[j, i] = self.rng.randint(60, 900)
+
+    def tearDown(self):
+        shutil.rmtree(self.cacheDir)
+
+    def saveRows(self, sources):
+        graph = makeGraph(self.edges)
+        paths, predecessors = dijkstra(graph, indices=sources, return_predecessors=True)
+        cache = path_cache.ShortestPathCache(self.cacheDir, self.zoneIds, graph)
+        cache.save(dict(zip(sources, paths)), dict(zip(sources, predecessors)))
+
+    def loadRows(self):
+        graph = makeGraph(self.edges)
+        paths, predecessors = path_cache.ShortestPathCache(self.cacheDir, self.zoneIds, graph).load()
+        return graph, paths, predecessors
+
+    def assertRowsCorrect(self, graph, paths, predecessors):
+        sources = sorted(paths)
+        expected = dijkstra(graph, indices=sources)
+        for source, expectedRow in zip(sources, expected):
+            numpy.testing.assert_array_equal(paths[source], expectedRow)
+            # Where there are several shortest paths, any will do
+            for target in numpy.flatnonzero(numpy.isfinite(expectedRow)):
+                if target != source:
+                    pre = predecessors[source][target]
+                    self.assertEqual(paths[source][pre] + graph[pre, target], paths[source][target])
+
+    def changeEdges(self, count, getSecs):
+        for i, j in self.rng.sample(sorted(self.edges), count):
+            secs = getSecs(self.edges[i, j])
+            if secs:
+                self.edges[i, j] = secs
+            else:
+                del self.edges[i, j]
+
+    def testExactMatch(self):
+        self.saveRows([ 0, 5, 7 ])
+        graph, paths, predecessors = self.loadRows()
+        self.assertEqual(sorted(paths), [ 0, 5, 7 ])
+        self.assertRowsCorrect(graph, paths, predecessors)
+
+    def testRepair(self):
+        sources = range(0, zoneCount, 3)
+        for step in range(5):
+            self.saveRows(sources)
+            self.changeEdges(4, lambda secs: secs * 2)
+            self.changeEdges(4, lambda secs: secs / 3)
+            self.changeEdges(2, lambda secs: 0)
+            for _ in range(3):
+                i, j = self.rng.sample(range(zoneCount), 2)
+                self.edges[i, j] = self.rng.randint(30, 120)
+            graph, paths, predecessors = self.loadRows()
+            self.assertTrue(set(sources).issubset(paths))
+            self.assertRowsCorrect(graph, paths, predecessors)
+
+    def testTooManyChanges(self):
+        self.saveRows([ 0, 1 ])
+        self.changeEdges(path_cache.ShortestPathCache.maxRepairEdges + 1, lambda secs: secs + 1)
+        graph, paths, predecessors = self.loadRows()
+        self.assertEqual(paths, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
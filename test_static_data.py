@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+
+import os, shutil, tempfile, unittest
+from pprint import pprint
+import static_data
+
+zones = { 1 : ("Zone1", 185, 1, 11.9, 57.7), 2 : ("Zone2", 65, 4, 12.0, 57.6) }
+
+class StaticZoneDataTest(unittest.TestCase):
+    def setUp(self):
+        self.dirName = tempfile.mkdtemp()
+        self.snapshotFile = os.path.join(self.dirName, static_data.snapshotName)
+
+    def tearDown(self):
+        shutil.rmtree(self.dirName)
+
+    def writeText(self, zones):
+        textFile = os.path.join(self.dirName, static_data.textName)
+        with open(textFile, "w") as f:
+            pprint(zones, f)
+        if os.path.isfile(self.snapshotFile):
+            # Newer than the snapshot, however coarse the file times are
+            stamp = os.path.getmtime(self.snapshotFile) + 10
+            os.utime(textFile, (stamp, stamp))
+
+    def testReaderLeavesFiles(self):
+        self.writeText(zones)
+        data = static_data.StaticZoneData.load(self.dirName)
+        self.assertEqual(data.zones, zones)
+        self.assertEqual(data.version, 0)
+        self.assertEqual(os.listdir(self.dirName), [ static_data.textName ])
+
+    def testPollerWritesSnapshot(self):
+        self.writeText(zones)
+        data = static_data.StaticZoneData.load(self.dirName, poller=True)
+        self.assertEqual(data.version, 1)
+        self.assertEqual(static_data.StaticZoneData.load(self.dirName).version, 1)
+        changedZones = dict(zones)
+        changedZones[3] = ("Zone3", 250, 0, 12.1, 57.8)
+        self.writeText(changedZones)
+        data = static_data.StaticZoneData.load(self.dirName)
+        self.assertEqual((data.version, data.zones), (1, changedZones))
+        data = static_data.StaticZoneData.load(self.dirName, poller=True)
+        self.assertEqual((data.version, data.zones), (2, changedZones))
+
+    def testSave(self):
+        data = static_data.StaticZoneData.load(self.dirName, poller=True)
+        self.assertFalse(data.save())
+        for zoneId, values in zones.items():
+            data.update(zoneId, values)
+        self.assertTrue(data.save())
+        data = static_data.StaticZoneData.load(self.dirName)
+        self.assertEqual((data.version, data.zones), (1, zones))
+        data.update(2, ("Zone2", 65, 3, 12.0, 57.6))
+        data.save()
+        self.assertEqual(len(open(os.path.join(self.dirName, static_data.changeLogName)).readlines()), 3)
+        self.assertEqual(sorted(os.listdir(self.dirName)), sorted([ static_data.textName, static_data.snapshotName, static_data.changeLogName ]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+
+import json, time, threading, unittest
+import BaseHTTPServer, SocketServer
+import requests
+import turf_api
+
+class StubServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    def __init__(self):
+        BaseHTTPServer.HTTPServer.__init__(self, ("127.0.0.1", 0), StubHandler)
+        self.lock = threading.Lock()
+        self.requestSizes = []
+        self.failuresLeft = 0
+        self.failureCode = 500
+
+class StubHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    # Answers with the zones asked for by id, after failing as many requests as it's told to
+    def do_POST(self):
+        requestData = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with self.server.lock:
+            self.server.requestSizes.append(len(requestData))
+            fail = self.server.failuresLeft > 0
+            if fail:
+                self.server.failuresLeft -= 1
+        if fail:
+            return self.sendJson(self.server.failureCode, { "error" : "failed" })
+        ids = [ item["id"] for item in requestData ]
+        # Earlier chunks answer last, so that the threads finish out of order
+        time.sleep(0.05 if ids[0] == 0 else 0)
+        self.sendJson(200, [ { "id" : zoneId, "name" : "Zone" + str(zoneId) } for zoneId in ids ])
+
+    def sendJson(self, code, data):
+        body = json.dumps(data)
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class TurfApiTest(unittest.TestCase):
+    def setUp(self):
+        self.server = StubServer()
+        threading.Thread(target=self.server.serve_forever).start()
+        self.origUrl, self.origBackoff = turf_api.apiUrl, turf_api.backoffSecs
+        turf_api.apiUrl = "http://127.0.0.1:" + str(self.server.server_address[1])
+        turf_api.backoffSecs = 0.01
+
+    def tearDown(self):
+        turf_api.apiUrl, turf_api.backoffSecs = self.origUrl, self.origBackoff
+        self.server.shutdown()
+        self.server.server_close()
+
+    def getZoneIds(self, count):
+        zoneInfoList, _ = turf_api.get_zones_from_list("id", range(count))
+        return [ zoneInfo["id"] for zoneInfo in zoneInfoList ]
+
+    def testOneChunk(self):
+        self.assertEqual(self.getZoneIds(100), range(100))
+        self.assertEqual(self.server.requestSizes, [ 100 ])
+
+    def testChunksInOrder(self):
+        self.assertEqual(self.getZoneIds(450), range(450))
+        self.assertEqual(sorted(self.server.requestSizes), [ 50, 100, 100, 100, 100 ])
+
+    def testRetries(self):
+        self.server.failuresLeft = 3
+        self.assertEqual(self.getZoneIds(250), range(250))
+        self.assertEqual(len(self.server.requestSizes), 6)
+
+    def testGivesUp(self):
+        self.server.failuresLeft = turf_api.maxAttempts
+        self.assertRaises(requests.HTTPError, self.getZoneIds, 10)
+        self.assertEqual(len(self.server.requestSizes), turf_api.maxAttempts)
+
+    def testNoRetryForBadRequest(self):
+        self.server.failuresLeft, self.server.failureCode = 1, 400
+        self.assertRaises(requests.HTTPError, self.getZoneIds, 10)
+        self.assertEqual(len(self.server.requestSizes), 1)
+
+    def testRetriesConnection(self):
+        self.server.shutdown()
+        self.server.server_close()
+        sleeps = []
+        origSleep, time.sleep = time.sleep, sleeps.append
+        try:
+            self.assertRaises(requests.ConnectionError, self.getZoneIds, 10)
+        finally:
+            time.sleep = origSleep
+        self.assertEqual(len(sleeps), turf_api.maxAttempts - 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
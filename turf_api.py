@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+
+# Shared access to the turf API. All requests go over one keep-alive session, and long
+# lists of zones or users are split into batches that are sent concurrently and retried if the failure might pass.
+# Set TURF_API_URL to point the scripts at a different server, e.g. a local stand-in for testing.
+
+import requests, os, time
+import run_profile
+from multiprocessing.pool import ThreadPool
+
+apiUrl = os.getenv("TURF_API_URL", "http://api.turfgame.com").rstrip("/")
+chunkSize = 100
+maxWorkers = 4
+maxAttempts = 4
+backoffSecs = 1.0
+
+session = requests.Session()
+adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=maxWorkers)
+session.mount("http://", adapter)
+session.mount("https://", adapter)
+
+def post(path, requestData):
+    r = session.post(apiUrl + path, json=requestData)
+    r.raise_for_status()
+    run_profile.countRequest(len(r.request.body or ""), len(r.content))
+    return r
+
+def isTransient(e):
+    # Connections, timeouts and server errors can come right, but a request the server rejects never will
+    if isinstance(e, requests.HTTPError):
+        return e.response is not None and e.response.status_code >= 500
+    return isinstance(e, (requests.ConnectionError, requests.Timeout))
+
+def postWithRetries(path, requestData):
+    for attempt in range(maxAttempts):
+        try:
+            r = post(path, requestData)
+            return r.json(), r.encoding
+        except requests.RequestException, e:
+            if attempt == maxAttempts - 1 or not isTransient(e):
+                raise
+            time.sleep(backoffSecs * 2 ** attempt)
+
+def postInChunks(path, requestData):
+    chunks = [ requestData[i:i + chunkSize] for i in range(0, len(requestData), chunkSize) ]
+    if len(chunks) <= 1:
+        return postWithRetries(path, requestData)
+
+    pool = ThreadPool(min(maxWorkers, len(chunks)))
+    try:
+        results = pool.map(lambda chunk: postWithRetries(path, chunk), chunks)
+    finally:
+        pool.close()
+        pool.join()
+    allData = []
+    for data, _ in results:
+        allData += data
+    return allData, results[0][1]
+
+def get_zones_from_list(dataType, info):
+    return postInChunks("/v4/zones", [{ dataType : zdat } for zdat in info ])
+
+def get_users_from_list(dataType, info):
+    return postInChunks("/v4/users", [{ dataType : udat } for udat in info ])[0]
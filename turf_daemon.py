@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+
+# Long-running alternative to running get_turf_data.py from cron.
+# Keeps the zone state in memory, polls zones that change hands often more frequently,
+# appends only new takeovers to the data file and does the monthly rollover itself.
+
+import os, sys, time, math, random, shutil, argparse, subprocess
+from datetime import datetime, timedelta
+import takeover_log, get_turf_data, poll_scheduler, static_data
+from get_turf_data import currDir
+
+cronIntervalMins = 20 # how often crontab.sample runs get_turf_data.py, which fetches every zone
+
+def getNextRollover(now):
+    # Turf rolls over at noon on the first Sunday of each month
+    year, month = now.year, now.month
+    while True:
+        firstDay = datetime(year, month, 1, 12)
+        rollover = firstDay + timedelta(days=(6 - firstDay.weekday()) % 7)
+        if rollover > now:
+            return rollover
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+def saveTopList():
+    with open(os.path.join(currDir, "prev_toplist.txt"), "w") as f:
+        subprocess.call([ sys.executable, os.path.join(currDir, "show_top.py") ], stdout=f)
+
+def copyFinishedRound():
+    if os.path.isfile(get_turf_data.fileName):
+        shutil.copyfile(get_turf_data.fileName, os.path.join(currDir, "prev_turf_data.bin"))
+
+class PollingDaemon:
+    def __init__(self, args):
+        self.args = args
+        self.user = get_turf_data.read_config_user()
+        self.latestData = takeover_log.latestRecords(get_turf_data.fileName)
+        self.staticZoneData = static_data.StaticZoneData.load(currDir, poller=True)
+        # One connection to the SQLite store for as long as the daemon runs, None without sqlite3
+        self.store = get_turf_data.open_store()
+        self.zoneIds = []
+        self.scheduler = poll_scheduler.PollScheduler(args.budget, args.interval * 60)
+        self.scheduler.readHistory(get_turf_data.fileName)
+        self.scheduler.readState(get_turf_data.scheduleFile)
+        self.nextZoneRefresh = 0
+        self.nextRollover = getNextRollover(datetime.now())
+        self.topListSaved = False
+
+    def log(self, *items):
+        sys.stdout.write(datetime.now().strftime("%Y-%m-%d %H:%M:%S") + " " + " ".join(map(str, items)) + "\n")
+        sys.stdout.flush()
+
+    def refreshMonitoredZones(self, now):
+        self.zoneIds = get_turf_data.get_monitored_zones(self.user, self.latestData, self.store)
+        self.nextZoneRefresh = now + cronIntervalMins * 60
+        if self.args.budget is None:
+            # Fetch no more zones than polling them all from cron would
+            self.scheduler.budget = int(math.ceil(len(self.zoneIds) * self.args.min_interval / cronIntervalMins))
+
+    def pollZones(self, now):
+        pollIds = self.scheduler.chooseZones(self.zoneIds, now)
+        newRecords = get_turf_data.poll_zones(pollIds, self.latestData, self.staticZoneData)
+        self.scheduler.recordPoll(pollIds, newRecords, now)
+        self.scheduler.writeState(get_turf_data.scheduleFile)
+        self.staticZoneData.save()
+        get_turf_data.update_store(self.staticZoneData.zones, self.store)
+        changedCount = len([ r for r in newRecords if r[1] ])
+        self.log("Polled", len(pollIds), "zones,", changedCount, "taken since last time.", self.scheduler.describeMissed(self.zoneIds, now))
+
+    def getMaxSleepSecs(self):
+        return self.args.min_interval * 60 + self.args.jitter
+
+    def runOnce(self):
+        # Like the cron jobs: the top list is saved before the rollover, the round's log copied after it
+        now = time.time()
+        if datetime.now() >= self.nextRollover:
+            self.log("Rolling over")
+            copyFinishedRound()
+            self.nextRollover = getNextRollover(datetime.now())
+            self.topListSaved = False
+            self.nextZoneRefresh = 0
+        elif not self.topListSaved and (self.nextRollover - datetime.now()).total_seconds() < self.getMaxSleepSecs():
+            # The next poll could be after the rollover
+            self.log("Saving the top list")
+            saveTopList()
+            self.topListSaved = True
+        if now >= self.nextZoneRefresh:
+            self.refreshMonitoredZones(now)
+        self.pollZones(now)
+
+    def run(self):
+        while True:
+            try:
+                self.runOnce()
+            except Exception, e:
+                self.log("ERROR:", repr(e))
+            time.sleep(self.args.min_interval * 60 + random.uniform(0, self.args.jitter))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Poll turf data continuously')
+    parser.add_argument('-i', '--interval', type=float, default=60, help='maximum minutes between polls of any zone')
+    parser.add_argument('-n', '--min-interval', type=float, default=5, help='minutes between polls')
+    parser.add_argument('-b', '--budget', type=int, help='maximum number of zones to fetch in each poll, ' + \
+                        'by default as many as fetching them all every ' + str(cronIntervalMins) + ' minutes would')
+    parser.add_argument('-j', '--jitter', type=float, default=60, help='maximum random delay in seconds added to each poll')
+    PollingDaemon(parser.parse_args()).run()
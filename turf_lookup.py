@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Quick lookups from the local data, for the questions show_zone.py and show_user.py answer by asking the turf API
+# every time; turf.py is "turf_lookup.py zones". Zones, users and takeovers come from the SQLite store that get_turf_data.py
+# keeps up to date, and the API is only asked when the data is stale: when nothing has been polled for a while, or the zone
+# or user isn't known locally, or this Python has no sqlite3. The requests module and the API code are only imported then.
+#
+#   turf_lookup.py zone <name or id>    the zone's values, and who took it last and when. The name needn't have
+#                                       accents, and the start of it will do if no other zone starts the same way
+#   turf_lookup.py user [name or id]    the user's place, and for the configured user how many of the monitored zones they hold
+#   turf_lookup.py zones [name or id]   when the user took each of the zones they hold, like turf.py
+
+import os, sys, time, argparse
+from datetime import datetime
+from contextlib import contextmanager
+import takeover_log, user_directory
+
+currDir = os.path.dirname(os.path.abspath(__file__))
+logFile = os.path.join(currDir, "curr_turf_data.bin")
+configFileName = os.path.join(currDir, "turf_config.txt")
+
+def getConfigUser():
+    if os.path.isfile(configFileName):
+        return eval(open(configFileName).read()).get("username")
+
+def getKey(text):
+    return int(text) if text.isdigit() else text.decode("utf-8")
+
+def formatEpoch(epoch):
+    return datetime.fromtimestamp(epoch).strftime("%Y-%m-%d %H:%M")
+
+def formatApiDate(dateStr):
+    return formatEpoch(takeover_log.parseApiDate(dateStr))
+
+def encode(text):
+    return text.encode("utf-8")
+
+def openStore():
+    try:
+        import turf_store
+    except ImportError:
+        return
+    return turf_store.TurfStore(os.path.join(currDir, turf_store.defaultName))
+
+def importApi():
+    import requests, turf_api
+    reqver = tuple(map(int, requests.__version__.split(".")))
+    if reqver <= (2, 4, 1):
+        sys.stderr.write("ERROR: Python requests module must be at least version 2.4.2, found version " + requests.__version__ + "\n")
+        sys.exit(1)
+    return turf_api
+
+@contextmanager
+def askingApi():
+    # The API's errors end the lookup, but not local ones. requests is only imported once the API is asked,
+    # so if it hasn't been, nothing can have raised one of its exceptions
+    try:
+        yield
+    except Exception, e:
+        requests = sys.modules.get("requests")
+        if not isinstance(e, ValueError) and (requests is None or not isinstance(e, requests.RequestException)):
+            raise
+        sys.stderr.write("ERROR: Turf not responding properly\n" + str(e) + "\n")
+        sys.exit(1)
+
+class Lookup:
+    def __init__(self, maxAgeSecs):
+        self.store = openStore()
+        lastPoll = self.store.getLastPoll() if self.store else None
+        self.fresh = lastPoll is not None and time.time() - lastPoll < maxAgeSecs
+        self.directory = user_directory.UserDirectory(os.path.join(currDir, user_directory.defaultName), self.store)
+
+    def findUser(self, key):
+        # Returns (id, name, place) from the user directory, which asks the API if it hasn't seen the user lately
+        with askingApi():
+            userId = key if isinstance(key, int) else self.directory.getUserId(key)
+            entry = self.directory.getUserInfo([ userId ]).get(userId, {})
+        return userId, entry.get("name", unicode(userId)), entry.get("place")
+
+    def getUserName(self, userId):
+        row = self.store.findUser(userId)
+        return row[1] if row else self.findUser(userId)[1]
+
+    def isConfigUser(self, userId):
+        # Only the configured user's zones are all monitored, so only their holdings can be read from the store
+        configUser = getConfigUser()
+        return configUser is not None and self.findUser(getKey(str(configUser)))[0] == userId
+
+    def showZone(self, key):
+        if self.store is None:
+            return self.showZoneFromApi(key)
+        row = self.store.findZone(key)
+        if row is None and not isinstance(key, int):
+            matches = self.store.findZonesByPrefix(key)
+            if len(matches) > 1:
+                print "Zones starting with", encode(key) + ":", ", ".join((encode(match[1]) for match in matches))
+                return
+            row = matches[0] if matches else None
+        if row is None or not self.fresh:
+            # Known zones are asked about by id, which is found locally even when the takeovers are stale
+            return self.showZoneFromApi(row[0] if row else key)
+        zoneId, name, takepoints, pph, longitude, latitude = row
+        print encode(name), "(" + str(takepoints) + "/+" + str(pph) + ")", "at", latitude, longitude
+        lastTakeover = self.store.getLastTakeover(logFile, zoneId)
+        if lastTakeover:
+            ownerId, epoch = lastTakeover
+            print "Taken by", encode(self.getUserName(ownerId)), "at", formatEpoch(epoch)
+
+    def showZoneFromApi(self, key):
+        turf_api = importApi()
+        with askingApi():
+            zoneInfoList, _ = turf_api.get_zones_from_list("id" if isinstance(key, int) else "name", [ key ])
+        for zoneInfo in zoneInfoList:
+            print encode(zoneInfo["name"]), "(" + str(zoneInfo["takeoverPoints"]) + "/+" + str(zoneInfo["pointsPerHour"]) + ")", \
+                "at", zoneInfo["latitude"], zoneInfo["longitude"]
+            if "currentOwner" in zoneInfo and "dateLastTaken" in zoneInfo:
+                print "Taken by", encode(zoneInfo["currentOwner"]["name"]), "at", formatApiDate(zoneInfo["dateLastTaken"])
+
+    def showUser(self, key):
+        userId, name, place = self.findUser(key)
+        text = encode(name) + ", place " + str(place)
+        if self.fresh and self.isConfigUser(userId):
+            text += ", holds " + str(len(self.store.getHeldZones(logFile, userId))) + " of the monitored zones"
+        print text
+
+    def showZones(self, key):
+        if not self.fresh:
+            return self.showZonesFromApi(key)
+        userId = self.findUser(key)[0]
+        heldZones = dict(self.store.getHeldZones(logFile, userId))
+        if self.isConfigUser(userId):
+            zoneIds, otherZoneInfo = heldZones.keys(), []
+        else:
+            # Other users can hold zones that aren't monitored: the API says which zones they hold,
+            # and is only asked about the ones the store doesn't know they took
+            turf_api = importApi()
+            with askingApi():
+                zoneIds = turf_api.get_users_from_list("id", [ userId ])[0]["zones"]
+                otherIds = [ zoneId for zoneId in zoneIds if zoneId not in heldZones ]
+                otherZoneInfo = turf_api.get_zones_from_list("id", otherIds)[0] if otherIds else []
+        names = self.store.getZoneNames([ zoneId for zoneId in zoneIds if zoneId in heldZones ])
+        zonesTaken = [ (epoch, names.get(zoneId, unicode(zoneId))) for zoneId, epoch in heldZones.items() if zoneId in zoneIds ]
+        zonesTaken += [ (takeover_log.parseApiDate(zoneInfo["dateLastTaken"]), zoneInfo["name"]) for zoneInfo in otherZoneInfo ]
+        print "You own", len(zoneIds), "zones!"
+        for epoch, name in sorted(zonesTaken):
+            print formatEpoch(epoch), ":", encode(name)
+
+    def showZonesFromApi(self, key):
+        turf_api = importApi()
+        with askingApi():
+            userInfo = turf_api.get_users_from_list("id" if isinstance(key, int) else "name", [ key ])[0]
+            print "You own", len(userInfo["zones"]), "zones!"
+            zoneInfoList, _ = turf_api.get_zones_from_list("id", userInfo["zones"])
+        for zoneInfo in sorted(zoneInfoList, key=lambda info: info["dateLastTaken"]):
+            print formatApiDate(zoneInfo["dateLastTaken"]), ":", encode(zoneInfo["name"])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Look up zones and users from the local turf data')
+    parser.add_argument('what', choices=[ "zone", "user", "zones" ], help='what to look up')
+    parser.add_argument('name', nargs="?", help='zone or user name or id, the configured user if not given')
+    parser.add_argument('-a', '--max-age', type=float, default=60, help='minutes since the last poll after which the turf API is asked instead')
+    args = parser.parse_args(argv)
+    name = args.name or (getConfigUser() if args.what != "zone" else None)
+    if not name:
+        parser.error("no " + args.what + " given")
+    lookup = Lookup(args.max_age * 60)
+    method = { "zone" : lookup.showZone, "user" : lookup.showUser, "zones" : lookup.showZones }[args.what]
+    method(getKey(name))
+
+if __name__ == "__main__":
+    main()
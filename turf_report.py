@@ -1,11 +1,18 @@
 #!/usr/bin/env python
-from datetime import datetime, timedelta
-import time, sys, requests, os, argparse
+from datetime import datetime
+import time, sys, os, argparse, calendar
 from pprint import pprint
 from glob import glob
 from collections import OrderedDict
+import takeover_log, report_checkpoint, user_directory, spatial_index, route_optimizer, search_trace, connection_stats, run_profile, zone_names, static_data
 
-class Zone:
+# Set from turf_config.txt when run as a script
+default_user = None
+home_latitude, home_longitude = None, None
+localRadiusKm = 0.75
+
+class Zone(object):
+    __slots__ = ("zoneId", "name", "takepoints", "pph", "prevExpectedPoints", "longitude", "latitude", "expectedPoints")
     allZones = {}
     @classmethod
     def makeZone(cls, zoneId, *args):
@@ -31,8 +38,8 @@ class Zone:
     def getPoints(self, hoursHeld):
         return self.takepoints + int(hoursHeld * self.pph)
 
-    def getAverage(self, allPoints):
-        return int(round(float(sum(allPoints)) / len(allPoints)))
+    def getAverage(self, pointTotal, pointCount):
+        return int(round(float(pointTotal) / pointCount))
 
     def matchesDirection(self, direction):
         if direction is None:
@@ -46,15 +53,11 @@ class Zone:
         elif direction == "north":
             return self.latitude > home_latitude
         elif direction == "local":
-            long_diff = self.longitude - home_longitude
-            lat_diff = self.latitude - home_latitude
-            long_measure = abs(long_diff)
-            lat_measure = abs(lat_diff) * 1.2 # Wild approximation of earth's curvature :)
-            return long_measure < 0.01 and lat_measure < 0.01
+            return spatial_index.haversine(home_latitude, home_longitude, self.latitude, self.longitude) < localRadiusKm
         else:
             return True
 
-    def setExpectedPoints(self, rulePeriods, forUserNow=None):
+    def setExpectedPoints(self, rulePeriods, forUserNow=None, completePointTotals=None):
         if len(rulePeriods) > 0 and forUserNow:
             currentPeriod = rulePeriods[-1]
             if currentPeriod.user == forUserNow and not currentPeriod.complete:
@@ -73,15 +76,18 @@ class Zone:
                 self.expectedPoints = self.prevExpectedPoints
                 return
 
-        allPoints = [ self.getPoints(p.getHours()) for p in rulePeriods if p.complete ]
+        if completePointTotals is None:
+            allPoints = [ self.getPoints(p.getHours()) for p in rulePeriods if p.complete ]
+            completePointTotals = sum(allPoints), len(allPoints)
+        pointTotal, pointCount = completePointTotals
         if self.prevExpectedPoints is not None:
-            allPoints.append(self.prevExpectedPoints)
-        self.expectedPoints = self.getAverage(allPoints)
+            pointTotal += self.prevExpectedPoints
+            pointCount += 1
+        self.expectedPoints = self.getAverage(pointTotal, pointCount)
         if not rulePeriods[-1].complete:
             incompletePoints = self.getPoints(rulePeriods[-1].getHours())
             if incompletePoints > self.expectedPoints:
-                allPoints.append(incompletePoints)
-                self.expectedPoints = self.getAverage(allPoints)
+                self.expectedPoints = self.getAverage(pointTotal + incompletePoints, pointCount + 1)
 
     def getExpectedPointsOutput(self):
         txt = "Expected = " + str(self.expectedPoints) if self.expectedPoints else ""
@@ -89,13 +95,13 @@ class Zone:
             txt += " (" + str(self.prevExpectedPoints) + ")"
         return txt
  
-class User:
+class User(object):
+    __slots__ = ("userId", "userName", "place")
+    directory = None
     @classmethod
     def getUserInfo(cls, userIds):
-        userRequestData = [{ "id" : uid } for uid in userIds.keys() ]
-        r = requests.post('http://api.turfgame.com/v4/users', json=userRequestData)
-        for userInfo in r.json():
-            user = userIds.get(userInfo["id"])
+        for userId, userInfo in cls.directory.getUserInfo(userIds.keys()).items():
+            user = userIds.get(userId)
             user.setInfo(userInfo)
         
     def __init__(self, userId=None, userName=None):
@@ -114,10 +120,7 @@ class User:
         self.place = userInfo["place"]
 
     def getUserId(self, name):
-        info = {}
-        userRequestData = [{ "name" : name }]
-        r = requests.post('http://api.turfgame.com/v4/users', json=userRequestData)
-        return r.json()[0]["id"]
+        return self.directory.getUserId(name)
 
     def __repr__(self):
         name = self.userName or str(self.userId)
@@ -128,22 +131,31 @@ def dtOut(dt):
     return dt.strftime("%Y-%m-%d %H:%M") if dt else ""
 
 
-class RulePeriod:
-    def __init__(self, zone, user, startTime, endTime, complete=True):
+class RulePeriod(object):
+    # Times are seconds since the epoch in local time, converted to datetimes only for output
+    __slots__ = ("zone", "user", "startEpoch", "endEpoch", "complete")
+    def __init__(self, zone, user, startEpoch, endEpoch, complete=True):
         self.zone = zone
         self.user = user
-        self.startTime = startTime
-        self.endTime = endTime
+        self.startEpoch = startEpoch
+        self.endEpoch = endEpoch
         self.complete = complete
 
+    @property
+    def startTime(self):
+        return datetime.utcfromtimestamp(self.startEpoch)
+
+    @property
+    def endTime(self):
+        return datetime.utcfromtimestamp(self.endEpoch)
+
     def hoursOut(self, hourFloat):
         wholeHours = int(hourFloat)
         rem = hourFloat - wholeHours
         return str(wholeHours).rjust(2) + ":" + str(int(rem * 60)).rjust(2, "0")
 
     def getHours(self):
-        timeHeld = self.endTime - self.startTime
-        return timeHeld.total_seconds() / 3600.0
+        return (self.endEpoch - self.startEpoch) / 3600.0
 
     def __repr__(self):
         hoursHeld = self.getHours()
@@ -155,77 +167,74 @@ class RulePeriod:
             endTimeOut = dtOut(self.endTime)
         return dtOut(self.startTime).ljust(20) + endTimeOut.ljust(20) + (hoursText.rjust(6) + suffix).ljust(10) + str(points).rjust(4) + suffix.ljust(5)
 
-class Journey:
-    def __init__(self, startZone, endZone, startTime, endTime):
-        self.startZone = startZone
-        self.endZone = endZone
-        self.startTime = startTime
-        self.endTime = endTime
-
-    def getDuration(self):
-        return self.endTime - self.startTime
-
 def formatSeconds(secs):
     return datetime.utcfromtimestamp(secs).strftime("%M:%S")
 
     
 class Connection:
     walkCycleRatio = 1.6 # If it's more than twice the average it's probably walking where there is cycling :)
-    def __init__(self, startZone, endZone):
+    def __init__(self, startZone, endZone, durations=None):
         self.startZone = startZone
         self.endZone = endZone
-        self.journeys = []
+        self.durations = durations or connection_stats.DurationStats()
         self.avgDuration = None
+        self.maxCycling = None
     
-    def addJourney(self, j):
-        self.journeys.append(j)
+    def addJourney(self, startEpoch, endEpoch):
+        self.durations.add(endEpoch - startEpoch)
         
     def formatDuration(self, duration):
         return formatSeconds(duration.seconds)
 
-    def removeWalking(self, durations):
-        newDurations = []
-        newJourneys = []
-        maxCycling = timedelta(seconds=(self.avgDuration.seconds * self.walkCycleRatio)) 
-        for i, duration in enumerate(durations):
-            if duration <= maxCycling:
-                newDurations.append(duration)
-                newJourneys.append(self.journeys[i])
-        self.journeys = newJourneys
-        return newDurations
-
     def updateAverage(self):
-        durations = [ j.getDuration() for j in self.journeys ]
-        while True:
-            journeyCount = len(durations)
-            self.avgDuration = sum(durations, timedelta()) / journeyCount
-            newDurations = self.removeWalking(durations)
-            if len(durations) == len(newDurations):
-                break
-            durations = newDurations
+        self.avgDuration, self.maxCycling = self.durations.getAverage(self.walkCycleRatio)
  
     def description(self, zone):
         outbound = zone is self.startZone
         otherZone = self.endZone if outbound else self.startZone
         avgStr = self.formatDuration(self.avgDuration)
         directionStr = "-> " if outbound else "<- "
-        durations = [ j.getDuration() for j in self.journeys ]
+        durations = self.durations.getCounted(self.maxCycling)
         return directionStr + otherZone.name.ljust(15).encode("utf-8") + ("(" + str(otherZone.expectedPoints) + ")").ljust(15) + \
-            avgStr.ljust(10) + "(" + str(len(self.journeys)) + " journeys)   " + ", ".join(map(self.formatDuration, durations))
+            avgStr.ljust(10) + "(" + str(len(durations)) + " journeys)   " + ", ".join(map(formatSeconds, durations))
+
+
+class ConnectionIndex:
+    # One Connection per (start zone, end zone), and each zone's connections by (other zone, outbound)
+    def __init__(self, stats=None):
+        self.stats = stats
+        self.connections = {}
+        self.connectionsByZone = {}
+
+    def addJourney(self, startZone, endZone, startEpoch, endEpoch):
+        connection = self.connections.get((startZone, endZone))
+        if connection is None:
+            durations = self.stats.getDurations(startZone.zoneId, endZone.zoneId) if self.stats else None
+            connection = self.connections[startZone, endZone] = Connection(startZone, endZone, durations)
+            self.connectionsByZone.setdefault(startZone, {})[endZone, True] = connection
+            if endZone is not startZone:
+                self.connectionsByZone.setdefault(endZone, {})[startZone, False] = connection
+        # Stored statistics already have the journeys from earlier runs
+        if self.stats:
+            self.stats.addJourney(startZone.zoneId, endZone.zoneId, startEpoch, endEpoch)
+        else:
+            connection.addJourney(startEpoch, endEpoch)
 
+    def updateAverages(self):
+        for connection in self.connections.values():
+            connection.updateAverage()
 
-def convertToJourneys(rulePeriods):
+def makeConnectionIndex(rulePeriods, stats=None):
+    index = ConnectionIndex(stats)
     prevPeriod = None
-    journeysByZone = {}
     for period in rulePeriods:
         if prevPeriod is not None:
-            journeyTime = period.startTime - prevPeriod.startTime
-            if journeyTime <= timedelta(minutes=20):
-                journey = Journey(prevPeriod.zone, period.zone, prevPeriod.startTime, period.startTime)
-                journeysByZone.setdefault(prevPeriod.zone, []).append(journey)
-                journeysByZone.setdefault(period.zone, []).append(journey)
+            journeyTime = period.startEpoch - prevPeriod.startEpoch
+            if journeyTime <= 20 * 60:
+                index.addJourney(prevPeriod.zone, period.zone, prevPeriod.startEpoch, period.startEpoch)
         prevPeriod = period
-    return journeysByZone
+    index.updateAverages()
+    return index
 
             
 def parseEndDate(dateStr):
@@ -238,116 +247,208 @@ def getUser(userArg):
         else:
             return User(userName=userArg)
 
-def parseZoneData(fileName, finished, showUser, staticData, prevAvgData):
-    now = datetime.now()
-    tzOffset = now - datetime.utcnow()
+# Rule periods are produced as a stream, one zone at a time, so only the zones being worked on
+# are ever held as objects. The stages are chained in streamZonePeriods.
+
+def iterZoneRecords(fileName, staticData):
+    checkpoint = report_checkpoint.ReportCheckpoint.load(fileName)
+    checkpoint.update(staticData)
+    for zoneId, periods in checkpoint.periodsByZone.iteritems():
+        takepoints, pph = staticData.get(zoneId)[1:3]
+        yield zoneId, periods, checkpoint.currentOwners.get(zoneId), checkpoint.getPointTotals(zoneId, takepoints, pph)
+    checkpoint.save()
+
+def filterDirection(zoneRecords, staticData, prevAvgData, direction, areaZoneIds=None):
+    for zoneId, periods, current, pointTotals in zoneRecords:
+        if areaZoneIds is not None and zoneId not in areaZoneIds:
+            continue
+        zone = Zone.makeZone(zoneId, prevAvgData.get(zoneId), *staticData.get(zoneId))
+        if zone.matchesDirection(direction):
+            yield zone, periods, current, pointTotals
+
+def makeRulePeriods(zoneRecords, fileName, finished, userIds):
+    tzOffset = takeover_log.getLocalOffset()
+    now = int(time.time()) + tzOffset
     if finished:
-        now = parseEndDate(fileName[:10])
+        now = toEpoch(parseEndDate(fileName[:10]))
 
-    zoneData = eval(open(fileName).read())
+    for zone, periods, current, (pointTotal, pointCount) in zoneRecords:
+        zonePeriods = []
+        for userId, startEpoch, endEpoch in periods:
+            user = userIds.setdefault(userId, User(userId))
+            zonePeriods.append(RulePeriod(zone, user, startEpoch + tzOffset, endEpoch + tzOffset))
 
+        if current is not None:
+            userId, startEpoch = current
+            user = userIds.setdefault(userId, User(userId))
+            rulePeriod = RulePeriod(zone, user, startEpoch + tzOffset, now, complete=finished)
+            zonePeriods.append(rulePeriod)
+            if finished:
+                pointTotal += zone.getPoints(rulePeriod.getHours())
+                pointCount += 1
+        yield zone, zonePeriods, (pointTotal, pointCount)
+
+def setExpectedPointsInBatches(zonePeriodStream, forUserNow):
+    rulePeriodsByZone, pointTotalsByZone = OrderedDict(), {}
+    for zone, zonePeriods, pointTotals in zonePeriodStream:
+        rulePeriodsByZone[zone] = zonePeriods
+        pointTotalsByZone[zone] = pointTotals
+        if len(rulePeriodsByZone) >= batchZoneThreshold:
+            with run_profile.stage("expected points"):
+                setAllExpectedPoints(rulePeriodsByZone, forUserNow, pointTotalsByZone)
+            for item in rulePeriodsByZone.items():
+                yield item
+            rulePeriodsByZone.clear()
+            pointTotalsByZone.clear()
+    with run_profile.stage("expected points"):
+        setAllExpectedPoints(rulePeriodsByZone, forUserNow, pointTotalsByZone)
+    for item in rulePeriodsByZone.items():
+        yield item
+
+def streamZonePeriods(fileName, finished, staticData, prevAvgData, direction=None, forUserNow=None, userIds=None, areaZoneIds=None):
+    userIds = {} if userIds is None else userIds
+    zoneRecords = filterDirection(iterZoneRecords(fileName, staticData), staticData, prevAvgData, direction, areaZoneIds)
+    return setExpectedPointsInBatches(makeRulePeriods(zoneRecords, fileName, finished, userIds), forUserNow)
+
+def filterUserPeriods(zonePeriods, showUser):
+    return [ p for p in zonePeriods if showUser is None or showUser == p.user ]
+
+def parseZoneData(fileName, finished, showUser, staticData, prevAvgData, direction=None, areaZoneIds=None):
     userIds = {}
     allRulePeriods = []
     rulePeriodsByZone = {}
+    pointTotalsByZone = {}
+    zoneRecords = filterDirection(iterZoneRecords(fileName, staticData), staticData, prevAvgData, direction, areaZoneIds)
+    for zone, zonePeriods, pointTotals in makeRulePeriods(zoneRecords, fileName, finished, userIds):
+        allRulePeriods += filterUserPeriods(zonePeriods, showUser)
+        rulePeriodsByZone[zone] = zonePeriods
+        pointTotalsByZone[zone] = pointTotals
+    return userIds, allRulePeriods, rulePeriodsByZone, pointTotalsByZone
+
+batchZoneThreshold = 500
+
+def toEpoch(dt):
+    return calendar.timegm(dt.timetuple())
+
+def setAllExpectedPoints(rulePeriodsByZone, forUserNow, pointTotalsByZone):
+    # Working on all zones at once only pays off for many zones, and needs numpy
+    if len(rulePeriodsByZone) >= batchZoneThreshold:
+        try:
+            import expected_points
+        except ImportError:
+            pass
+        else:
+            return setBatchExpectedPoints(expected_points, rulePeriodsByZone, forUserNow, pointTotalsByZone)
+    for zone, zonePeriods in rulePeriodsByZone.items():
+        zone.setExpectedPoints(zonePeriods, forUserNow, pointTotalsByZone.get(zone))
+
+def setBatchExpectedPoints(expected_points, rulePeriodsByZone, forUserNow, pointTotalsByZone):
+    # Completed periods are already summed in the checkpoint, so only the last period of each zone is needed
+    zones = rulePeriodsByZone.keys()
+    lastPeriods = [ (i, rulePeriodsByZone[zone][-1]) for i, zone in enumerate(zones) if rulePeriodsByZone[zone] ]
+    nan = float("nan")
+    expected = expected_points.calculateExpectedPoints(
+        [ zone.takepoints for zone in zones ], [ zone.pph for zone in zones ],
+        [ nan if zone.prevExpectedPoints is None else zone.prevExpectedPoints for zone in zones ],
+        [ i for i, _ in lastPeriods ], [ p.startEpoch for _, p in lastPeriods ], [ p.endEpoch for _, p in lastPeriods ],
+        [ p.user.userId for _, p in lastPeriods ], [ p.complete for _, p in lastPeriods ],
+        forUserId=forUserNow.userId if forUserNow else None,
+        completeTotals=zip(*[ pointTotalsByZone[zone] for zone in zones ]),
+        periodCounts=[ len(rulePeriodsByZone[zone]) for zone in zones ])
+    for zone, points in zip(zones, expected):
+        if points == points:
+            zone.expectedPoints = int(points)
+
+def openStore(dirName):
+    # The store lets per-user reports skip other users' zones, but the logs have everything without it
+    try:
+        import turf_store
+    except ImportError:
+        return
+    return turf_store.TurfStore(os.path.join(dirName, turf_store.defaultName))
+
+def findZoneMatches(store, staticData, name):
+    # Returns (zoneId, name) for the zone with the name, without case or accents, or else for the zones starting with it.
+    # The static data is searched if there's no store, or the store hasn't been given the zones yet
+    if store:
+        row = store.findZone(name)
+        matches = [ row[:2] ] if row else [ row[:2] for row in store.findZonesByPrefix(name) ]
+        if matches:
+            return matches
+    normName = zone_names.normaliseName(name)
+    matches = [ (zoneId, info[0]) for zoneId, info in staticData.iteritems() if zone_names.normaliseName(info[0]) == normName ]
+    exactMatches = [ match for match in matches if match[1] == name ]
+    if len(exactMatches) == 1 or len(matches) == 1:
+        return (exactMatches or matches)[:1]
+    elif matches:
+        return matches
+    else:
+        return [ (zoneId, info[0]) for zoneId, info in staticData.iteritems() if zone_names.normaliseName(info[0]).startswith(normName) ]
+
+def getZoneId(store, staticData, name):
+    matches = findZoneMatches(store, staticData, name)
+    if len(matches) == 1:
+        return matches[0][0]
+    elif matches:
+        names = ", ".join(sorted((matchName for _, matchName in matches)))
+        sys.stderr.write("ERROR: several zones match " + name.encode("utf-8") + ": " + names.encode("utf-8") + "\n")
+    else:
+        sys.stderr.write("ERROR: no zone called " + name.encode("utf-8") + "\n")
+    sys.exit(1)
 
-    for zoneId, takeoverInfo in zoneData.items():
-        prevAvg = prevAvgData.get(zoneId)
-        zone = Zone.makeZone(zoneId, prevAvg, *staticData.get(zoneId))
-        if not zone.matchesDirection(args.direction):
-            continue
-        currRulePeriods = rulePeriodsByZone.setdefault(zone, []) 
-        prevDt, prevUser = None, None
-        for dateStr, userId in takeoverInfo:
-            user = userIds.setdefault(userId, User(userId))
-            if user == prevUser:
-                continue
-            dt = datetime.strptime(dateStr[:-5], "%Y-%m-%dT%H:%M:%S")
-            dtLocal = dt + tzOffset
-            if prevDt:
-                rulePeriod = RulePeriod(zone, prevUser, prevDt, dtLocal)
-                if showUser is None or showUser == prevUser:
-                    allRulePeriods.append(rulePeriod)
-                currRulePeriods.append(rulePeriod)
-            prevDt = dtLocal
-            prevUser = user
-
-        if prevDt is not None:
-            rulePeriod = RulePeriod(zone, prevUser, prevDt, now, complete=finished)
-            if showUser is None or showUser == prevUser:
-                allRulePeriods.append(rulePeriod)
-            currRulePeriods.append(rulePeriod)
-    return userIds, allRulePeriods, rulePeriodsByZone
-
-def makeConnections(zone, journeys):
-    connections = {}
-    for journey in journeys:
-        outbound = zone is journey.startZone
-        otherZone = journey.endZone if outbound else journey.startZone
-        connections.setdefault((otherZone, outbound), Connection(journey.startZone, journey.endZone)).addJourney(journey)
-    for connection in connections.values():
-        connection.updateAverage()
-    return connections
-
-def addDataFromEarlierRounds(allRulePeriods, *args):
-    for histfn in glob("*-*-*_turf_data.txt"):
-        _, rulePeriods, _ = parseZoneData(histfn, True, *args)
-        allRulePeriods += rulePeriods
-    allRulePeriods.sort(key=lambda rp: rp.startTime)
-
-def printTimeReport(journeysByZone):
-    for zone in sorted(journeysByZone.keys(), key=lambda z: z.expectedPoints, reverse=True):
-        journeys = journeysByZone.get(zone)
-        connections = makeConnections(zone, journeys)
+def getEarlierRounds():
+    return glob("*-*-*_turf_data.bin")
+
+def getEarlierUserPeriods(histfn, showUser, staticData, tzOffset, zoneIds, store):
+    # Returns (zoneId, startEpoch, endEpoch) in local time, for the given zones if not None
+    roundEndTime = toEpoch(parseEndDate(histfn[:10]))
+    if store is None:
+        # Without sqlite3, each round's checkpoint is indexed by user instead
+        import history_index
+        index = history_index.HistoryIndex.load(histfn, tzOffset)
+        return [ period for period in index.getUserPeriods(showUser.userId, roundEndTime, staticData) if zoneIds is None or period[0] in zoneIds ]
+    return store.getUserPeriods(histfn, showUser.userId, zoneIds, tzOffset, roundEndTime)
+
+def getDirectionZoneIds(staticData, prevAvgData, direction, areaZoneIds):
+    if direction is None:
+        return areaZoneIds
+    zoneIds = areaZoneIds if areaZoneIds is not None else staticData.keys()
+    return set((zoneId for zoneId in zoneIds if Zone.makeZone(zoneId, prevAvgData.get(zoneId), *staticData.get(zoneId)).matchesDirection(direction)))
+
+def addDataFromEarlierRounds(allRulePeriods, showUser, staticData, prevAvgData, direction=None, areaZoneIds=None, store=None):
+    tzOffset = takeover_log.getLocalOffset()
+    zoneIds = getDirectionZoneIds(staticData, prevAvgData, direction, areaZoneIds)
+    for histfn in getEarlierRounds():
+        for zoneId, startEpoch, endEpoch in getEarlierUserPeriods(histfn, showUser, staticData, tzOffset, zoneIds, store):
+            zone = Zone.makeZone(zoneId, prevAvgData.get(zoneId), *staticData.get(zoneId))
+            allRulePeriods.append(RulePeriod(zone, showUser, startEpoch, endEpoch))
+    allRulePeriods.sort(key=lambda rp: rp.startEpoch)
+
+def printTimeReport(connectionIndex):
+    for zone in sorted(connectionIndex.connectionsByZone.keys(), key=lambda z: z.expectedPoints, reverse=True):
+        connections = connectionIndex.connectionsByZone.get(zone)
         print zone, zone.getExpectedPointsOutput()
         for (otherZone, outbound) in sorted(connections.keys(), key = lambda (z, o): (z.expectedPoints, o), reverse = True):
             connection = connections.get((otherZone, outbound))
             print "  ", connection.description(zone)
 
 class ZonePath:
-    def __init__(self, zones, totalTime):
-        self.pivotZone = None
-        self.allPivots = set()
-        self.prePivot = None
-        self.postPivot = None
+    def __init__(self, zones, totalTime, pivotZone=None, allPivots=()):
+        self.pivotZone = pivotZone
+        self.allPivots = set(allPivots)
         self.totalTime = totalTime
         self.allZones = []
         zonesSeen = set()
         for z, secs in zones:
-            points = 0 if z in zonesSeen else z.expectedPoints
+            points = 0 if z in zonesSeen else z.expectedPoints or 0
             self.allZones.append((z, points, secs))
             zonesSeen.add(z)
         self.totalPoints = sum((p for (z, p, s) in self.allZones))
         self.pointsPerSecond = float(self.totalPoints) / self.totalTime if self.totalTime else 0
         
-    def setPivot(self, pivot):
-        self.pivotZone = pivot
-        self.allPivots.add(pivot)
-
-    def setPrePivot(self, path):
-        self.prePivot = path
-        if path.pivotZone:
-            self.allPivots.add(path.pivotZone)
-
-    def setPostPivot(self, path):
-        self.postPivot = path
-        if path.pivotZone:
-            self.allPivots.add(path.pivotZone)
-    
     def getTimeStr(self):
         return formatSeconds(self.totalTime)
 
-    def addOn(self, pivotZone, otherPath):
-        zoneInfo = [(z, s) for (z, p, s) in self.allZones]
-        zoneInfo.append((pivotZone, self.totalTime))
-        zoneInfo += [ (z, self.totalTime + s) for (z, p, s) in otherPath.allZones ]
-        newPath = ZonePath(zoneInfo, self.totalTime + otherPath.totalTime)
-        newPath.setPivot(pivotZone)
-        newPath.setPrePivot(self)
-        newPath.setPostPivot(otherPath)
-        newPath.allPivots.update(self.allPivots)
-        newPath.allPivots.update(otherPath.allPivots)
-        return newPath
-
     def __repr__(self):
         ppsText = str(round(self.pointsPerSecond, 2))
         text = "Journey takes " + self.getTimeStr() + " and expects " + str(self.totalPoints) + " points = " + ppsText + " pps.\n"
@@ -356,43 +457,119 @@ class ZonePath:
             text += prefix + "via " + repr(zone) + " = " + str(points).rjust(4) + " after " + formatSeconds(secs) + "\n"
         return text
 
-    def __cmp__(self, other):
-        val = cmp(other.pointsPerSecond, self.pointsPerSecond)
-        if val:
-            return val
-        
-        return cmp(self.pivotZone.name, other.pivotZone.name)
+class IndexPath(object):
+    # What the route finder searches with: zone indices with the times they are reached,
+    # a bitset of the zones visited and running totals. ZonePaths are only made for printing.
+    __slots__ = ("indices", "times", "totalTime", "visited", "totalPoints", "pivotIx", "allPivots", "prePivot", "postPivot")
+    def __init__(self, indices, times, totalTime, points):
+        self.indices = tuple(indices)
+        self.times = tuple(times)
+        self.totalTime = totalTime
+        self.visited, self.totalPoints = self.addVisits(0, 0, self.indices, points)
+        self.pivotIx, self.allPivots, self.prePivot, self.postPivot = None, frozenset(), None, None
+
+    @staticmethod
+    def addVisits(visited, totalPoints, indices, points):
+        for ix in indices:
+            bit = 1 << ix
+            if not visited & bit:
+                visited |= bit
+                totalPoints += points[ix]
+        return visited, totalPoints
+
+    def getPointsPerSecond(self):
+        return float(self.totalPoints) / self.totalTime if self.totalTime else 0
+
+    def addOn(self, pivotIx, otherPath, points):
+        newPath = IndexPath.__new__(IndexPath)
+        newPath.indices = self.indices + (pivotIx,) + otherPath.indices
+        newPath.times = self.times + (self.totalTime,) + tuple((self.totalTime + secs for secs in otherPath.times))
+        newPath.totalTime = self.totalTime + otherPath.totalTime
+        newPath.visited, newPath.totalPoints = self.addVisits(self.visited, self.totalPoints, (pivotIx,) + otherPath.indices, points)
+        newPath.pivotIx, newPath.prePivot, newPath.postPivot = pivotIx, self, otherPath
+        newPath.allPivots = self.allPivots.union(otherPath.allPivots, [ pivotIx ])
+        return newPath
+
+class ShortestPathRows(dict):
+    # Rows of times or predecessors by source zone index, calculated when first needed
+    def __init__(self, handler):
+        dict.__init__(self)
+        self.handler = handler
+
+    def __missing__(self, source):
+        self.handler.calculateFrom([ source ])
+        return dict.__getitem__(self, source)
 
 class ShortestPathHandler:
-    def __init__(self, zones, startZoneName, endZoneName):
+    cacheDir = None
+    def __init__(self, zones, startZoneId, endZoneId):
         self.zoneIndices = OrderedDict()
         self.startIx, self.endIx = None, None
         for i, zone in enumerate(zones):
             self.zoneIndices[zone] = i
-            if zone.name.lower() == startZoneName.lower():
+            if zone.zoneId == startZoneId:
                 self.startIx = i
                 zone.expectedPoints = 0 # We're going there anyway... points for going again = 0
-            if zone.name.lower() == endZoneName.lower():
+            if zone.zoneId == endZoneId:
                 self.endIx = i
                 zone.expectedPoints = 0 # We're going there anyway...
-        self.time_matrix, self.shortest_paths, self.predecessors = None, None, None
-
-    def calculate(self, journeysByZone):
-        zoneCount = len(journeysByZone)
+        self.points = [ zone.expectedPoints or 0 for zone in zones ]
+        self.graph, self.cache, self.timesTo = None, None, {}
+        self.shortest_paths, self.predecessors = ShortestPathRows(self), ShortestPathRows(self)
+        self.rowsAdded = False
+
+    def calculate(self, connectionIndex):
+        # Each zone only connects to a few neighbours, so keep the times as a sparse graph
+        edges = {}
+        for (startZone, endZone), connection in connectionIndex.connections.items():
+            secs = connection.avgDuration.seconds
+            if secs:
+                edges[self.zoneIndices[startZone], self.zoneIndices[endZone]] = secs
+        # Where there is only a connection one way, assume the other way takes as long
+        for i, j in edges.keys():
+            edges.setdefault((j, i), edges[i, j])
+
+        from scipy.sparse import csr_matrix
+        zoneCount = len(self.zoneIndices)
+        keys = sorted(edges.keys())
+        rows = [ i for i, _ in keys ]
+        cols = [ j for _, j in keys ]
+        self.graph = csr_matrix(([ float(edges[key]) for key in keys ], (rows, cols)), shape=(zoneCount, zoneCount))
+        self.graph.sort_indices()
+        if self.cacheDir:
+            import path_cache
+            zoneIds = [ zone.zoneId for zone in self.zoneIndices ]
+            self.cache = path_cache.ShortestPathCache(self.cacheDir, zoneIds, self.graph)
+            paths, predecessors = self.cache.load()
+            self.shortest_paths.update(paths)
+            self.predecessors.update(predecessors)
+
+    def calculateFrom(self, sources):
+        # Run dijkstra once for all the sources we don't have yet
+        missing = sorted(set(sources).difference(self.shortest_paths))
+        if missing:
+            from scipy.sparse.csgraph import dijkstra
+            paths, predecessors = dijkstra(self.graph, indices=missing, return_predecessors=True)
+            for source, pathRow, predecessorRow in zip(missing, paths, predecessors):
+                self.shortest_paths[source] = pathRow
+                self.predecessors[source] = predecessorRow
+            self.rowsAdded = True
+
+    def getTimesTo(self, target):
+        # Times from every zone to the target, from a single search on the reversed graph
+        if target not in self.timesTo:
+            from scipy.sparse.csgraph import dijkstra
+            self.timesTo[target] = dijkstra(self.graph.transpose().tocsr(), indices=target)
+        return self.timesTo[target]
+
+    def getReachable(self, maxSecs, source, target):
         import numpy
-        self.time_matrix = numpy.zeros(shape=(zoneCount,zoneCount))
-        for i, (zone, journeys) in enumerate(journeysByZone.items()):
-            connections = makeConnections(zone, journeys)
-            for (otherZone, outbound), connection in connections.items():
-                secs = connection.avgDuration.seconds
-                j = self.zoneIndices[otherZone]
-                if outbound:
-                    self.time_matrix[i][j] = secs
-                    if self.time_matrix[j][i] == 0:
-                        self.time_matrix[j][i] = secs
-
-        from scipy.sparse.csgraph import dijkstra
-        self.shortest_paths, self.predecessors = dijkstra(self.time_matrix, return_predecessors=True)
+        totalTimes = self.shortest_paths[source] + self.getTimesTo(target)
+        return [ int(ix) for ix in numpy.flatnonzero(totalTimes <= maxSecs) ]
+
+    def saveCache(self):
+        if self.cache and self.rowsAdded:
+            self.cache.save(self.shortest_paths, self.predecessors)
 
     def getPathIndices(self, source, target):
         if source == target:
@@ -406,93 +583,132 @@ class ShortestPathHandler:
             else:
                 indices.insert(0, preIx)
 
+    def getEdgeSecs(self, source, target):
+        # Indexing the sparse matrix makes a new matrix each time, so find the entry in the row's sorted columns
+        graph = self.graph
+        start = graph.indptr[source]
+        k = start + graph.indices[start:graph.indptr[source + 1]].searchsorted(target)
+        return graph.data[k]
+
     def getShortestPath(self, source, target):
         if source == target:
-            return ZonePath([], 0)
+            return IndexPath([], [], 0, self.points)
                 
         preIx = source
-        zones = []
+        indices, times = [], []
         currTime = 0
         for ix in self.getPathIndices(source, target):
-            currTime += self.time_matrix[preIx][ix] 
-            zones.append((self.zoneIndices.keys()[ix], currTime))
+            currTime += self.getEdgeSecs(preIx, ix)
+            indices.append(int(ix))
+            times.append(currTime)
             preIx = ix
-        return ZonePath(zones, self.shortest_paths[source][target])
+        return IndexPath(indices, times, self.shortest_paths[source][target], self.points)
 
     def getPossiblePivots(self, maxSecs, source, target):
         indices = [ source ]
         if source != target:
             indices += [ target ] + self.getPathIndices(source, target)
         pivots = []
-        for ix in range(len(self.zoneIndices)):
+        timesFromPivot = self.getTimesTo(target)
+        for ix in self.getReachable(maxSecs, source, target):
             if ix in indices:
                 continue
-            timeToPivot = self.shortest_paths[source][ix]
-            if timeToPivot < 0 or timeToPivot > maxSecs:
-                continue
-
-            timeFromPivot = self.shortest_paths[ix][target]
-            if timeFromPivot < 0 or timeFromPivot > maxSecs:
-                continue
 
             points = self.zoneIndices.keys()[ix].expectedPoints
             if points == 0:
                 continue
 
-            combined = timeToPivot + timeFromPivot
-            if combined <= maxSecs:
-                pivots.append((ix, combined))
+            pivots.append((ix, self.shortest_paths[source][ix] + timesFromPivot[ix]))
+        # Paths onwards from the pivots will be needed
+        self.calculateFrom([ ix for ix, _ in pivots ])
         return pivots
    
 class RouteFinder:
+    maxCombinedPaths = 100
+    trace = search_trace.SearchTrace()
     @classmethod
-    def create(cls, journeysByZone, startZone, endZone):
-        allZones = journeysByZone.keys()
-        shortestPaths = ShortestPathHandler(allZones, startZone, endZone)
-        shortestPaths.calculate(journeysByZone)
+    def create(cls, connectionIndex, startZoneId, endZoneId):
+        allZones = sorted(connectionIndex.connectionsByZone.keys(), key=lambda zone: zone.zoneId)
+        shortestPaths = ShortestPathHandler(allZones, startZoneId, endZoneId)
+        shortestPaths.calculate(connectionIndex)
         return cls(shortestPaths, allZones)
     
     def __init__(self, shortestPaths, allZones):
         self.shortestPaths = shortestPaths
         self.allZones = allZones
+
+    def makeZonePath(self, path):
+        zones = [ (self.allZones[ix], secs) for ix, secs in zip(path.indices, path.times) ]
+        pivotZone = self.allZones[path.pivotIx] if path.pivotIx is not None else None
+        return ZonePath(zones, path.totalTime, pivotZone, [ self.allZones[ix] for ix in path.allPivots ])
+
+    def getSortKey(self, path):
+        # Best points per second first, then by pivot name
+        pivotName = self.allZones[path.pivotIx].name if path.pivotIx is not None else u""
+        return -path.getPointsPerSecond(), pivotName
         
     def findBest(self, maxTime):
         shortestPath = self.shortestPaths.getShortestPath(self.shortestPaths.startIx, self.shortestPaths.endIx)
         maxSecs = maxTime * 60
-        print "Journey takes at least", shortestPath.getTimeStr()
+        print "Journey takes at least", formatSeconds(shortestPath.totalTime)
         tryPaths = self.getPivotedPaths(shortestPath, maxSecs, self.shortestPaths.startIx, self.shortestPaths.endIx)
         print "Found", len(tryPaths), "pivoted paths"
+        if not tryPaths:
+            print "No route found within", maxTime, "minutes"
+            return
         best = tryPaths[0]
-        print best
+        print self.makeZonePath(best)
 
-        combined = self.addExtraPivots(best, maxSecs, self.shortestPaths.startIx, self.shortestPaths.endIx)
-        combined.sort()
+        combinedCount, combined = self.addExtraPivots(best, maxSecs, self.shortestPaths.startIx, self.shortestPaths.endIx)
         
-        print "Found", len(combined), "combined paths"
+        print "Found", combinedCount, "combined paths"
+        if not combined:
+            return
 
         bestCombined = combined[0]
-        print bestCombined
+        print self.makeZonePath(bestCombined)
         full = self.getExpandedPrePivot(bestCombined, maxSecs, self.shortestPaths.startIx)
         if full:
             print "Found", len(full), "paths for first half."
-            print full[0]
+            print self.makeZonePath(full[0])
             
             print "--- other combined for first half"
             for path in full[1:]:
-                print path
+                print self.makeZonePath(path)
         print "---"
         for path in combined[1:]:
-            print path
+            print self.makeZonePath(path)
+
+    def findOptimized(self, maxTime, searchSecs):
+        startIx, endIx = self.shortestPaths.startIx, self.shortestPaths.endIx
+        shortestPath = self.shortestPaths.getShortestPath(startIx, endIx)
+        print "Journey takes at least", formatSeconds(shortestPath.totalTime)
+        # Only zones that fit between start and end can be part of a route, so only search from those
+        self.shortestPaths.calculateFrom(self.shortestPaths.getReachable(maxTime * 60, startIx, endIx))
+        optimizer = route_optimizer.RouteOptimizer(self.shortestPaths.shortest_paths, self.shortestPaths.getPathIndices,
+                                                   self.shortestPaths.points, startIx, endIx, maxTime * 60, self.shortestPaths.getTimesTo(endIx),
+                                                   self.trace, [ zone.zoneId for zone in self.allZones ])
+        route, score = optimizer.optimize(searchSecs)
+        print "Tried", optimizer.evaluations, "routes"
+        if score is None:
+            print "No route found within", maxTime, "minutes"
+            return
+
+        path = None
+        stops = (startIx,) + route + (endIx,)
+        for i in range(len(stops) - 1):
+            segment = self.shortestPaths.getShortestPath(stops[i], stops[i + 1])
+            path = segment if path is None else path.addOn(stops[i], segment, self.shortestPaths.points)
+        print self.makeZonePath(path)
 
     def getExpandedPrePivot(self, path, maxSecs, startIx):
-        if path.prePivot.pivotZone:
-            pivotIx = self.shortestPaths.zoneIndices[path.pivotZone]
+        if path.prePivot.pivotIx is not None:
             maxPrePivot =  maxSecs - path.postPivot.totalTime
-            combined = self.addExtraPivots(path.prePivot, maxPrePivot, startIx, pivotIx)
+            _, combined = self.addExtraPivots(path.prePivot, maxPrePivot, startIx, path.pivotIx)
             if combined:
                 combined += self.getExpandedPrePivot(combined[0], maxPrePivot, startIx)
-            full = [ c.addOn(path.pivotZone, path.postPivot) for c in combined ]
-            full.sort()
+            full = [ c.addOn(path.pivotIx, path.postPivot, self.shortestPaths.points) for c in combined ]
+            full.sort(key=self.getSortKey)
             return full
         else:
             return []
@@ -506,135 +722,214 @@ class RouteFinder:
         for pivotIx, totalTime in pivots:
             path = self.shortestPaths.getShortestPath(startIx, pivotIx)
             pathFrom = self.shortestPaths.getShortestPath(pivotIx, endIx)
-            combined = path.addOn(self.allZones[pivotIx], pathFrom)
+            combined = path.addOn(pivotIx, pathFrom, self.shortestPaths.points)
             tryPaths.append(combined)
 
-        tryPaths.sort()
+        tryPaths.sort(key=self.getSortKey)
         return tryPaths
 
-    def logPaths(self, paths, f):
-        f.write("Found " + str(len(paths)) + " pivoted paths\n")
-        for path in paths:
-            f.write(repr(path) + "\n")
+    def tracePaths(self, direction, pivotZone, maxSecs, paths):
+        self.trace.record(1, "search", direction, pivotZone.zoneId, maxSecs, len(paths))
+        if self.trace.isEnabled(2):
+            for path in paths:
+                self.trace.record(2, "path", [ self.allZones[ix].zoneId for ix in path.indices ], path.totalTime, path.totalPoints)
             
     def addExtraPivots(self, pivotedPath, maxSecs, startIx, endIx): 
-        pivotIx = self.shortestPaths.zoneIndices[pivotedPath.pivotZone]
+        pivotIx = pivotedPath.pivotIx
+        pivotZone = self.allZones[pivotIx]
         maxFirst = maxSecs - pivotedPath.postPivot.totalTime
         maxSecond = maxSecs - pivotedPath.prePivot.totalTime
-        fn = "extra-" + pivotedPath.pivotZone.name.encode("utf-8") + ".turf"
-        with open(fn, "a") as f:
-            f.write("Sub: trying to get to " + repr(pivotedPath.pivotZone) + " in less than " + formatSeconds(maxFirst) + "\n")
-            firstPaths = self.getPivotedPaths(pivotedPath.prePivot, maxFirst, startIx, pivotIx)
-            self.logPaths(firstPaths, f)
-            f.write("Sub: trying to get from " + repr(pivotedPath.pivotZone) + " in less than " + formatSeconds(maxSecond) + "\n")
-            secondPaths = self.getPivotedPaths(pivotedPath.postPivot, maxSecond, pivotIx, endIx)
-            self.logPaths(secondPaths, f)
-
-        combined = []
-        for p1 in firstPaths:
-            for p2 in secondPaths:
-                if p1.totalTime + p2.totalTime <= maxSecs:
-                    combined.append(p1.addOn(pivotedPath.pivotZone, p2))
-        return combined
-
-def hasMeRecently(zonePeriods):
-    return any((p.user.userName == default_user for p in zonePeriods[-10:]))
-
-
-def describeZoneWithPeriods(zone, zonePeriods=[]):
-    print zone, zone.getExpectedPointsOutput()
-    if len(zonePeriods) <= 5 or hasMeRecently(zonePeriods):
-        for rulePeriod in zonePeriods:
-            print "  ", rulePeriod.user, rulePeriod
+        firstPaths = self.getPivotedPaths(pivotedPath.prePivot, maxFirst, startIx, pivotIx)
+        self.tracePaths("to", pivotZone, maxFirst, firstPaths)
+        secondPaths = self.getPivotedPaths(pivotedPath.postPivot, maxSecond, pivotIx, endIx)
+        self.tracePaths("from", pivotZone, maxSecond, secondPaths)
+
+        # Returns how many combinations fit, and only the best of them as paths
+        import pivot_scoring
+        points = self.shortestPaths.points
+        count, best = pivot_scoring.findBestCombinations([ p.indices for p in firstPaths ], [ p.totalTime for p in firstPaths ], pivotIx,
+                                                         [ p.indices for p in secondPaths ], [ p.totalTime for p in secondPaths ],
+                                                         points, maxSecs, self.maxCombinedPaths)
+        self.trace.record(1, "combined", pivotZone.zoneId, maxSecs, count)
+        return count, [ firstPaths[i].addOn(pivotIx, secondPaths[j], points) for i, j in best ]
+
+def parseCoordinates(text, count):
+    values = map(float, text.split(","))
+    if len(values) != count:
+        raise argparse.ArgumentTypeError("expected " + str(count) + " comma-separated numbers, got '" + text + "'")
+    return values
+
+def getAreaZoneIds(args, staticData):
+    if args.radius is None and args.nearest is None and args.box is None:
+        return
+    index = spatial_index.SpatialIndex.fromStaticData(staticData)
+    lat, long = args.point or (home_latitude, home_longitude)
+    areaZoneIds = set(staticData.keys())
+    if args.radius is not None:
+        areaZoneIds.intersection_update(index.withinRadius(lat, long, args.radius))
+    if args.nearest is not None:
+        areaZoneIds.intersection_update(index.nearest(lat, long, args.nearest))
+    if args.box is not None:
+        areaZoneIds.intersection_update(index.inBox(*args.box))
+    return areaZoneIds
+
+def hasMeRecently(zonePeriods, meUser):
+    return any((p.user == meUser for p in zonePeriods[-10:]))
+
+def summariseZonePeriods(zonePeriods, meUser):
+    # Only keep what describeZoneWithPeriods will print
+    if len(zonePeriods) <= 5 or hasMeRecently(zonePeriods, meUser):
+        return zonePeriods, False
     else:
-        print "   ..."
-        print "  ", zonePeriods[-1].user, zonePeriods[-1]
-
-
-
-currDir = os.getenv("TEXTTEST_SANDBOX", os.path.dirname(os.path.abspath(__file__)))
-defaultFile = os.path.join(currDir, "curr_turf_data.txt")
-configFileName = os.path.join(currDir, "turf_config.txt")
-if not os.path.isfile(configFileName):
-    sys.stderr.write("ERROR: no config file found at " + configFileName + ": please create!\n")
-    sys.exit(1)
-
-configDict = eval(open(configFileName).read())
-
-default_user = configDict.get("username")
-home_longitude = configDict.get("home_longitude")
-home_latitude = configDict.get("home_latitude")
-
-parser = argparse.ArgumentParser(description='Report turf data')
-parser.add_argument('-d', '--direction', help='only show zones in a certain direction from home')
-parser.add_argument('-f', '--file', default=defaultFile, help='turf data file to use')
-parser.add_argument('-z', '--zonefile', help='file to store zone average data in')
-parser.add_argument('-u', '--user', const=default_user, nargs="?", help='user to show data for')
-parser.add_argument('-t', '--timereport', action="store_true", help='show time data for zones')
-parser.add_argument('-b', '--begin', help='begin turfing at given zone')
-parser.add_argument('-e', '--end', help='end turfing at given zone')
-parser.add_argument('-m', '--maxtime', type=int, help='maximum time for turfing')
-parser.add_argument('-H', '--html', action='store_true', help='print output as html')
-
-
-
+        return zonePeriods[-1:], True
 
-args = parser.parse_args()
-
-showUser = getUser(args.user)
-
-staticFile = os.path.join(currDir, "static_zone_data.txt")
-staticData = eval(open(staticFile).read())
-
-prevAvgData = {}
-prevAvgFile = os.path.join(currDir, "prev_turf_avg.txt")
-if os.path.isfile(prevAvgFile):
-    prevAvgData = eval(open(prevAvgFile).read())
-
-userIds, allRulePeriods, rulePeriodsByZone = parseZoneData(args.file, args.file != defaultFile, showUser, staticData, prevAvgData)
-
-userForExpected =  showUser if args.begin else None
-for zone, zonePeriods in rulePeriodsByZone.items():
-    zone.setExpectedPoints(zonePeriods, userForExpected)
-
-if args.zonefile:
+def describeZoneWithPeriods(zone, zonePeriods=[], elided=False):
+    print zone, zone.getExpectedPointsOutput()
+    if elided:
+        print "   ..."
+    for rulePeriod in zonePeriods:
+        print "  ", rulePeriod.user, rulePeriod
+
+
+
+if __name__ == "__main__":
+    currDir = os.getenv("TEXTTEST_SANDBOX", os.path.dirname(os.path.abspath(__file__)))
+    defaultFile = os.path.join(currDir, "curr_turf_data.bin")
+    configFileName = os.path.join(currDir, "turf_config.txt")
+    if not os.path.isfile(configFileName):
+        sys.stderr.write("ERROR: no config file found at " + configFileName + ": please create!\n")
+        sys.exit(1)
+
+    configDict = eval(open(configFileName).read())
+
+    default_user = configDict.get("username")
+    home_longitude = configDict.get("home_longitude")
+    home_latitude = configDict.get("home_latitude")
+    localRadiusKm = configDict.get("local_radius", localRadiusKm)
+
+    parser = argparse.ArgumentParser(description='Report turf data')
+    parser.add_argument('-d', '--direction', help='only show zones in a certain direction from home')
+    parser.add_argument('-f', '--file', default=defaultFile, help='turf data file to use')
+    parser.add_argument('-z', '--zonefile', help='file to store zone average data in')
+    parser.add_argument('-u', '--user', const=default_user, nargs="?", help='user to show data for')
+    parser.add_argument('-t', '--timereport', action="store_true", help='show time data for zones')
+    parser.add_argument('-b', '--begin', help='begin turfing at given zone')
+    parser.add_argument('-e', '--end', help='end turfing at given zone')
+    parser.add_argument('-m', '--maxtime', type=int, help='maximum time for turfing')
+    parser.add_argument('-s', '--searchtime', type=float, default=10, help='maximum seconds to spend searching for a route')
+    parser.add_argument('-P', '--pivots', action='store_true', help='search for routes by enumerating pivot zones instead')
+    parser.add_argument('--profile', nargs="?", const="", help='append stage timings and peak memory as a JSON line to the given file, or ' + run_profile.defaultName)
+    parser.add_argument('-T', '--trace', type=int, default=0, help='write route search details to route_trace.txt: 1 for each search step, 2 for every path or route tried')
+    parser.add_argument('-H', '--html', action='store_true', help='print output as html')
+    parser.add_argument('-r', '--radius', type=float, help='only show zones within this many km of home or the given point')
+    parser.add_argument('-n', '--nearest', type=int, help='only show this many zones nearest to home or the given point')
+    parser.add_argument('-p', '--point', type=lambda t: parseCoordinates(t, 2), help='latitude,longitude to use instead of home')
+    parser.add_argument('-x', '--box', type=lambda t: parseCoordinates(t, 4), help='only show zones within south,west,north,east')
+
+
+
+
+    args = parser.parse_args()
+    txtFile = args.file[:-4] + ".txt" if args.file.endswith(".bin") else args.file
+    if args.file.endswith(".txt") or (not os.path.isfile(args.file) and os.path.isfile(txtFile)):
+        parser.error(txtFile + " is in the old text format: run convert_turf_data.py to convert it")
+    run_profile.start("turf_report", args.profile, currDir)
+
+    store = openStore(currDir)
+    User.directory = user_directory.UserDirectory(os.path.join(currDir, user_directory.defaultName), store)
+    ShortestPathHandler.cacheDir = os.path.join(currDir, "route_cache")
+    RouteFinder.trace = search_trace.SearchTrace(args.trace)
+    showUser = getUser(args.user)
+
+    with run_profile.stage("static data"):
+        staticData = static_data.StaticZoneData.load(currDir).zones
+
+        prevAvgData = {}
+        prevAvgFile = os.path.join(currDir, "prev_turf_avg.txt")
+        if os.path.isfile(prevAvgFile):
+            prevAvgData = eval(open(prevAvgFile).read())
+
+    if args.begin:
+        routeZoneIds = [ getZoneId(store, staticData, name.decode("utf-8")) for name in (args.begin, args.end or args.begin) ]
+
+    userForExpected =  showUser if args.begin else None
+    meUser = None if showUser else getUser(default_user)
     expectedData = {}
-    for zone in rulePeriodsByZone.keys():
-        expectedData[zone.zoneId] = zone.expectedPoints
-        
-    with open(args.zonefile, "w") as f:
-        pprint(expectedData, f)
-
-if args.html:
-    print '<meta http-equiv="Content-Type" content="text/html; charset=utf-8" />'
-    print '<pre>'
-
-
-if showUser:
-    allRulePeriods.sort(key=lambda rp: rp.startTime)
-    if args.timereport or args.begin:
-        addDataFromEarlierRounds(allRulePeriods, showUser, staticData, prevAvgData)
-        journeysByZone = convertToJourneys(allRulePeriods)
-        if args.timereport:
-            printTimeReport(journeysByZone)
+    allRulePeriods = []
+    zoneSummaries = []
+    areaZoneIds = getAreaZoneIds(args, staticData)
+    streamZoneIds = areaZoneIds
+    if showUser and store and not args.zonefile:
+        # Only the zones the user has held are reported on, including in earlier rounds if they are used
+        with run_profile.stage("user zones"):
+            logFileNames = [ args.file ] + (getEarlierRounds() if args.timereport or args.begin else [])
+            userZoneIds = store.getUserZoneIds(showUser.userId, logFileNames)
+            streamZoneIds = userZoneIds if areaZoneIds is None else areaZoneIds & userZoneIds
+    with run_profile.stage("zone periods"):
+        for zone, zonePeriods in streamZonePeriods(args.file, args.file != defaultFile, staticData, prevAvgData, args.direction, userForExpected, areaZoneIds=streamZoneIds):
+            if args.zonefile:
+                expectedData[zone.zoneId] = zone.expectedPoints
+            if showUser:
+                allRulePeriods += filterUserPeriods(zonePeriods, showUser)
+            else:
+                zoneSummaries.append((zone, summariseZonePeriods(zonePeriods, meUser)))
+
+    if args.zonefile:
+        with open(args.zonefile, "w") as f:
+            pprint(expectedData, f)
+
+    if args.html:
+        print '<meta http-equiv="Content-Type" content="text/html; charset=utf-8" />'
+        print '<pre>'
+
+
+    if showUser:
+        allRulePeriods.sort(key=lambda rp: rp.startEpoch)
+        if args.timereport or args.begin:
+            with run_profile.stage("earlier rounds"):
+                addDataFromEarlierRounds(allRulePeriods, showUser, staticData, prevAvgData, args.direction, areaZoneIds, store)
+            with run_profile.stage("connection index"):
+                stats = None
+                if args.file == defaultFile and args.direction is None and areaZoneIds is None:
+                    statsFile = os.path.join(currDir, "connection_stats", str(showUser.userId) + ".pickle")
+                    stats = connection_stats.ConnectionStats.load(statsFile, takeover_log.getLocalOffset())
+                    stats.checkLog(args.file, showUser.userId, getEarlierRounds())
+                connectionIndex = makeConnectionIndex(allRulePeriods, stats)
+                if stats:
+                    stats.save()
+            if args.timereport:
+                with run_profile.stage("time report"):
+                    printTimeReport(connectionIndex)
+            else:
+                print "There are", len(connectionIndex.connectionsByZone), "zones"
+                for zoneId in routeZoneIds:
+                    if Zone.allZones.get(zoneId) not in connectionIndex.connectionsByZone:
+                        sys.stderr.write("ERROR: no journeys to or from " + staticData[zoneId][0].encode("utf-8") + " to plan a route with\n")
+                        sys.exit(1)
+                with run_profile.stage("route graph"):
+                    routeFinder = RouteFinder.create(connectionIndex, *routeZoneIds)
+                with run_profile.stage("route search"):
+                    if args.pivots:
+                        routeFinder.findBest(args.maxtime)
+                    else:
+                        routeFinder.findOptimized(args.maxtime, args.searchtime)
+                    routeFinder.shortestPaths.saveCache()
+                routeFinder.trace.write(os.path.join(currDir, "route_trace.txt"))
         else:
-            print "There are", len(journeysByZone), "zones"
-            routeFinder = RouteFinder.create(journeysByZone, args.begin, args.end or args.begin)
-            routeFinder.findBest(args.maxtime)
+            for rulePeriod in allRulePeriods:
+                print rulePeriod.zone, rulePeriod, rulePeriod.zone.getExpectedPointsOutput()
     else:
-        for rulePeriod in allRulePeriods:
-            print rulePeriod.zone, rulePeriod, rulePeriod.zone.getExpectedPointsOutput()
-else:
-    User.getUserInfo(userIds)
-    neutrals = []
-    for zone in sorted(rulePeriodsByZone.keys(), key=lambda z: z.expectedPoints, reverse=True):
-        zonePeriods = rulePeriodsByZone.get(zone)
-        if zonePeriods:
-            describeZoneWithPeriods(zone, zonePeriods)
-        else:
-            neutrals.append(zone)
-    for zone in neutrals:
-        describeZoneWithPeriods(zone)
+        with run_profile.stage("user info"):
+            User.getUserInfo(dict(((p.user.userId, p.user) for _, (zonePeriods, _) in zoneSummaries for p in zonePeriods)))
+        with run_profile.stage("zone report"):
+            neutrals = []
+            for zone, (zonePeriods, elided) in sorted(zoneSummaries, key=lambda (z, s): z.expectedPoints, reverse=True):
+                if zonePeriods:
+                    describeZoneWithPeriods(zone, zonePeriods, elided)
+                else:
+                    neutrals.append(zone)
+            for zone in neutrals:
+                describeZoneWithPeriods(zone)
 
-if args.html:
-    print '</pre>'
+    if args.html:
+        print '</pre>'
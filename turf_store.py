@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+
+# SQLite store of takeovers, zones and users, so reports can ask for one user's or one area's takeovers
+# without reading every round in full. The binary logs stay the record of what was polled: each round's
+# takeovers are copied in as the log grows, keeping the log's record numbers so that periods come out in
+# exactly the order ReportCheckpoint sees them. A log that has shrunk or starts differently is copied afresh.
+# Zones and users are upserted from the static data and user directory, so the file can also be queried by hand.
+# Zones are also indexed by name without case or accents, so all the scripts can find them by name, or the start of it.
+
+import os, sqlite3
+import takeover_log, zone_names
+
+defaultName = "turf_data.sqlite"
+
+schema = """
+CREATE TABLE IF NOT EXISTS rounds (id INTEGER PRIMARY KEY, name TEXT UNIQUE, record_count INTEGER,
+                                   first_zone_id INTEGER, first_epoch INTEGER, first_owner_id INTEGER);
+CREATE TABLE IF NOT EXISTS takeovers (round_id INTEGER, seq INTEGER, zone_id INTEGER, epoch INTEGER, owner_id INTEGER);
+CREATE INDEX IF NOT EXISTS takeovers_by_zone ON takeovers (round_id, zone_id, seq);
+CREATE INDEX IF NOT EXISTS takeovers_by_user ON takeovers (owner_id, round_id, seq);
+CREATE TABLE IF NOT EXISTS zones (id INTEGER PRIMARY KEY, name TEXT, takepoints INTEGER, pph INTEGER, longitude REAL, latitude REAL,
+                                  norm_name TEXT);
+CREATE TABLE IF NOT EXISTS users (id INTEGER PRIMARY KEY, name TEXT, place INTEGER, time INTEGER);
+CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value);
+CREATE TEMPORARY TABLE area (zone_id INTEGER PRIMARY KEY);
+"""
+
+zoneColumns = "id, name, takepoints, pph, longitude, latitude"
+
+# A period starts at a takeover whose previous takeover of the zone was by someone else, and ends at
+# the next takeover of the zone by someone else, or at the given end time if there isn't one
+userPeriodsQuery = """
+SELECT t.zone_id, t.epoch + :offset,
+       COALESCE((SELECT n.epoch FROM takeovers n WHERE n.round_id = t.round_id AND n.zone_id = t.zone_id AND n.seq > t.seq
+                 AND n.owner_id != t.owner_id ORDER BY n.seq LIMIT 1) + :offset, :end)
+FROM takeovers t
+WHERE t.owner_id = :user AND t.round_id = :round
+  AND (SELECT p.owner_id FROM takeovers p WHERE p.round_id = t.round_id AND p.zone_id = t.zone_id AND p.seq < t.seq
+       ORDER BY p.seq DESC LIMIT 1) IS NOT t.owner_id
+"""
+
+class TurfStore:
+    def __init__(self, fileName):
+        self.fileName = fileName
+        self.db = sqlite3.connect(fileName)
+        self.db.executescript(schema)
+        self.addNormalisedNames()
+        self.db.execute("CREATE INDEX IF NOT EXISTS zones_by_name ON zones (norm_name)")
+
+    def addNormalisedNames(self):
+        # Stores from before zones were looked up by name don't have the column yet
+        if "norm_name" not in [ row[1] for row in self.db.execute("PRAGMA table_info(zones)") ]:
+            with self.db:
+                self.db.execute("ALTER TABLE zones ADD COLUMN norm_name TEXT")
+                self.db.executemany("UPDATE zones SET norm_name = ? WHERE id = ?",
+                                    [ (zone_names.normaliseName(name), zoneId) for zoneId, name in self.db.execute("SELECT id, name FROM zones") ])
+
+    def getRoundName(self, logFileName):
+        return os.path.basename(logFileName)
+
+    def findRound(self, name):
+        return self.db.execute("SELECT id, record_count, first_zone_id, first_epoch, first_owner_id FROM rounds WHERE name = ?",
+                               (name,)).fetchone()
+
+    def sync(self, logFileName):
+        # Copies in whatever the log has gained since last time, and returns the round's id
+        name = self.getRoundName(logFileName)
+        count = takeover_log.countRecords(logFileName)
+        row = self.findRound(name)
+        with self.db:
+            if row is not None:
+                roundId, recordCount, firstRecord = row[0], row[1], row[2:]
+                if takeover_log.isReplaced(logFileName, recordCount, firstRecord):
+                    self.db.execute("DELETE FROM takeovers WHERE round_id = ?", (roundId,))
+                    recordCount = 0
+            else:
+                roundId = self.db.execute("INSERT INTO rounds (name, record_count) VALUES (?, 0)", (name,)).lastrowid
+                recordCount = 0
+            if count > recordCount:
+                records = enumerate(takeover_log.iterRecords(logFileName, recordCount), recordCount)
+                self.db.executemany("INSERT INTO takeovers VALUES (?, ?, ?, ?, ?)",
+                                    ((roundId, seq, zoneId, epoch, ownerId) for seq, (zoneId, epoch, ownerId) in records if epoch))
+                self.db.execute("UPDATE rounds SET record_count = ?, first_zone_id = ?, first_epoch = ?, first_owner_id = ? WHERE id = ?",
+                                (count,) + takeover_log.readFirstRecord(logFileName) + (roundId,))
+        return roundId
+
+    def updateZones(self, staticData):
+        # Zones hardly ever change, so only write those that have
+        stored = dict(((row[0], row[1:]) for row in self.db.execute("SELECT " + zoneColumns + " FROM zones")))
+        changed = [ (zoneId,) + tuple(info) + (zone_names.normaliseName(info[0]),)
+                    for zoneId, info in staticData.iteritems() if stored.get(zoneId) != tuple(info) ]
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO zones (" + zoneColumns + ", norm_name) VALUES (?, ?, ?, ?, ?, ?, ?)", changed)
+        return len(changed)
+
+    def updateUsers(self, entries):
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO users VALUES (?, ?, ?, ?)",
+                                ((userId, entry["name"], entry["place"], entry["time"]) for userId, entry in entries.iteritems()))
+
+    def getUserZoneIds(self, userId, logFileNames):
+        query = "SELECT DISTINCT zone_id FROM takeovers INDEXED BY takeovers_by_user WHERE owner_id = ? AND round_id = ?"
+        zoneIds = set()
+        for logFileName in logFileNames:
+            zoneIds.update((zoneId for zoneId, in self.db.execute(query, (userId, self.sync(logFileName)))))
+        return zoneIds
+
+    def getUserPeriods(self, logFileName, userId, zoneIds=None, offset=0, endEpoch=None):
+        # Returns (zoneId, startEpoch, endEpoch) in order of start, only for the given zones if not None.
+        # The offset is added to the log's UTC epochs, and periods still going end at endEpoch
+        roundId = self.sync(logFileName)
+        query = userPeriodsQuery
+        if zoneIds is not None:
+            with self.db:
+                self.db.execute("DELETE FROM area")
+                self.db.executemany("INSERT INTO area VALUES (?)", ((zoneId,) for zoneId in zoneIds))
+            query += " AND t.zone_id IN (SELECT zone_id FROM area)"
+        params = { "user" : userId, "round" : roundId, "offset" : offset, "end" : endEpoch }
+        return self.db.execute(query + " ORDER BY t.epoch, t.zone_id, t.seq", params).fetchall()
+
+    def getHeldZones(self, logFileName, userId):
+        # Returns (zoneId, epoch) for the zones the user took last, with when they last took them
+        query = "SELECT t.zone_id, t.epoch FROM takeovers t INDEXED BY takeovers_by_user WHERE t.owner_id = :user AND t.round_id = :round " + \
+                "AND NOT EXISTS (SELECT 1 FROM takeovers n WHERE n.round_id = t.round_id AND n.zone_id = t.zone_id AND n.seq > t.seq)"
+        return self.db.execute(query, (userId, self.sync(logFileName))).fetchall()
+
+    def getLastTakeover(self, logFileName, zoneId):
+        query = "SELECT owner_id, epoch FROM takeovers WHERE round_id = ? AND zone_id = ? ORDER BY seq DESC LIMIT 1"
+        return self.db.execute(query, (self.sync(logFileName), zoneId)).fetchone()
+
+    def findZone(self, key):
+        # Finds a zone by id, or by name without case or accents. Where that matches several zones, the one with
+        # exactly the name given is found, and if there isn't one, nothing is: findZonesByPrefix lists them all
+        if isinstance(key, (int, long)):
+            return self.db.execute("SELECT " + zoneColumns + " FROM zones WHERE id = ?", (key,)).fetchone()
+        rows = self.db.execute("SELECT " + zoneColumns + " FROM zones WHERE norm_name = ?", (zone_names.normaliseName(key),)).fetchall()
+        name = key.decode("utf-8") if isinstance(key, str) else key
+        exactRows = [ row for row in rows if row[1] == name ]
+        if len(rows) == 1 or len(exactRows) == 1:
+            return (exactRows or rows)[0]
+
+    def findZonesByPrefix(self, prefix, limit=20):
+        normPrefix = zone_names.normaliseName(prefix)
+        if not normPrefix:
+            return []
+        query = "SELECT " + zoneColumns + " FROM zones WHERE norm_name >= ? AND norm_name < ? ORDER BY norm_name LIMIT ?"
+        return self.db.execute(query, (normPrefix, zone_names.getPrefixEnd(normPrefix), limit)).fetchall()
+
+    def getZoneNames(self, zoneIds):
+        names = {}
+        for zoneId in zoneIds:
+            row = self.db.execute("SELECT name FROM zones WHERE id = ?", (zoneId,)).fetchone()
+            if row:
+                names[zoneId] = row[0]
+        return names
+
+    def findUser(self, key):
+        if isinstance(key, (int, long)):
+            return self.db.execute("SELECT id, name, place, time FROM users WHERE id = ?", (key,)).fetchone()
+        return self.db.execute("SELECT id, name, place, time FROM users WHERE name = ? COLLATE NOCASE", (key,)).fetchone()
+
+    def setLastPoll(self, epoch):
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO state VALUES ('last_poll', ?)", (epoch,))
+
+    def getLastPoll(self):
+        row = self.db.execute("SELECT value FROM state WHERE key = 'last_poll'").fetchone()
+        return row[0] if row else None
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+
+# Cache of user names and places, kept on disk between runs so that reports only ask
+# the turf API about users they haven't seen recently. The API module, and requests with it,
+# is only imported when that happens. Stored as JSON: the user_directory.txt written with pprint
+# by earlier versions is read if there is no JSON file yet, and converted.
+
+import os, time, json, tempfile
+
+defaultName = "user_directory.json"
+
+def getUsersFromApi(dataType, info):
+    import turf_api
+    return turf_api.get_users_from_list(dataType, info)
+
+class UserDirectory:
+    ttlSecs = 24 * 3600
+    def __init__(self, fileName, store=None):
+        self.fileName = fileName
+        self.store = store
+        self.entries = {}
+        self.idsByName = {}
+        self.changed = False
+        self.load()
+
+    def load(self):
+        legacyFileName = os.path.splitext(self.fileName)[0] + ".txt"
+        if os.path.isfile(self.fileName):
+            with open(self.fileName) as f:
+                entries = dict(((int(uid), entry) for uid, entry in json.load(f).iteritems()))
+        elif os.path.isfile(legacyFileName):
+            entries = eval(open(legacyFileName).read())
+            self.changed = True
+        else:
+            entries = {}
+        for uid, entry in entries.iteritems():
+            self.addEntry(uid, entry)
+        self.save()
+
+    def isFresh(self, entry, now):
+        return entry is not None and now - entry["time"] < self.ttlSecs
+
+    def addEntry(self, uid, entry):
+        self.entries[uid] = entry
+        self.idsByName[entry["name"].lower()] = uid
+
+    def addUserInfo(self, userInfo, now):
+        self.addEntry(userInfo["id"], { "name" : userInfo["name"], "place" : userInfo.get("place"), "time" : now })
+        self.changed = True
+
+    def getUserInfo(self, userIds):
+        now = int(time.time())
+        staleIds = [ uid for uid in userIds if not self.isFresh(self.entries.get(uid), now) ]
+        if staleIds:
+            for userInfo in getUsersFromApi("id", staleIds):
+                self.addUserInfo(userInfo, now)
+            self.save()
+        return dict(((uid, self.entries[uid]) for uid in userIds if uid in self.entries))
+
+    def getUserId(self, name):
+        now = int(time.time())
+        uid = self.idsByName.get(name.lower())
+        if uid is not None and self.entries[uid]["name"].lower() == name.lower() and self.isFresh(self.entries[uid], now):
+            return uid
+        userInfo = getUsersFromApi("name", [ name ])[0]
+        self.addUserInfo(userInfo, now)
+        self.save()
+        return userInfo["id"]
+
+    def save(self):
+        if self.changed:
+            fd, tmpFile = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.fileName)), suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(self.entries, f, indent=1, sort_keys=True)
+            os.rename(tmpFile, self.fileName)
+            if self.store:
+                self.store.updateUsers(self.entries)
+            self.changed = False
@@ -0,0 +1,17 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Zone names as they are matched when looking zones up: without case or accents, so that "vastra"
+# finds "Västra". Letters that aren't accented versions of others, like "ø", are kept as they are.
+
+import unicodedata
+
+def normaliseName(name):
+    if isinstance(name, str):
+        name = name.decode("utf-8")
+    decomposed = unicodedata.normalize("NFKD", name)
+    return u"".join((c for c in decomposed if not unicodedata.combining(c))).lower()
+
+def getPrefixEnd(prefix):
+    # The first string after all those starting with the prefix
+    return prefix[:-1] + unichr(ord(prefix[-1]) + 1)